@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request or document cannot be admitted.
+    status is 503 when the service as a whole is saturated and 429 when a
+    single client is over its share; retry_after is in seconds.
+    """
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Global admission control for PDF processing.
+
+    - At most `max_active` documents are extracted at the same time.
+    - At most `max_pending` documents may wait for a slot; beyond that new
+      work is rejected with 503 instead of piling up on CPU and memory.
+    - A client may have at most `max_client_requests` uploads in flight (429).
+    - Free slots are handed out round-robin across clients, so one large
+      batch cannot starve a department that uploads a handful of files.
+    """
+
+    def __init__(self, max_active, max_pending, max_client_requests, queue_timeout=60, min_retry_after=5):
+        self.max_active = max_active
+        self.max_pending = max_pending
+        self.max_client_requests = max_client_requests
+        self.queue_timeout = queue_timeout
+        self.min_retry_after = min_retry_after
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._waiting = {}  # client -> deque of waiting tickets
+        self._turns = deque()  # round-robin order of clients with waiting tickets
+        self._requests = {}  # client -> uploads in flight
+        self._client_active = {}  # client -> documents being processed
+
+        # Counters for /stats/queue
+        self._admitted = 0
+        self._rejected = {503: 0, 429: 0}
+        self._processed = 0
+        self._wait_total = 0.0
+        self._service_total = 0.0
+
+    def _retry_after(self):
+        # Rough time for the current backlog to drain through the active slots
+        avg_service = self._service_total / self._processed if self._processed else 1.0
+        backlog = (self._queued + self._active) / max(self.max_active, 1)
+        return max(self.min_retry_after, int(backlog * avg_service + 0.5))
+
+    def _reject(self, status, reason):
+        self._rejected[status] += 1
+        raise Overloaded(status, self._retry_after(), reason)
+
+    def _dispatch(self):
+        # Grant free slots to the head ticket of each client in turn
+        while self._active < self.max_active and self._turns:
+            client = self._turns.popleft()
+            tickets = self._waiting[client]
+            ticket = tickets.popleft()
+            ticket["granted"] = True
+            self._active += 1
+            self._queued -= 1
+            self._client_active[client] = self._client_active.get(client, 0) + 1
+            if tickets:
+                self._turns.append(client)
+            else:
+                del self._waiting[client]
+        self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, client):
+        """Admit one upload request from `client` or raise Overloaded."""
+        with self._cond:
+            if self._queued >= self.max_pending:
+                self._reject(503, "Document queue is full")
+            if self._requests.get(client, 0) >= self.max_client_requests:
+                self._reject(429, "Too many concurrent uploads from this client")
+            self._requests[client] = self._requests.get(client, 0) + 1
+            self._admitted += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._requests[client] -= 1
+                if not self._requests[client]:
+                    del self._requests[client]
+
+    @contextmanager
+    def slot(self, client):
+        """Wait (fairly) for a processing slot for one document of `client`."""
+        with self._cond:
+            if self._queued >= self.max_pending:
+                self._reject(503, "Document queue is full")
+
+            ticket = {"granted": False}
+            if client not in self._waiting:
+                self._waiting[client] = deque()
+                self._turns.append(client)
+            self._waiting[client].append(ticket)
+            self._queued += 1
+            self._dispatch()
+
+            enqueued_at = time.monotonic()
+            deadline = enqueued_at + self.queue_timeout
+            while not ticket["granted"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Give up our place in the queue
+                    tickets = self._waiting[client]
+                    tickets.remove(ticket)
+                    self._queued -= 1
+                    if not tickets:
+                        del self._waiting[client]
+                        self._turns.remove(client)
+                    self._reject(503, "Timed out waiting for a processing slot")
+                self._cond.wait(remaining)
+
+            started_at = time.monotonic()
+            self._wait_total += started_at - enqueued_at
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._client_active[client] -= 1
+                if not self._client_active[client]:
+                    del self._client_active[client]
+                self._processed += 1
+                self._service_total += time.monotonic() - started_at
+                self._dispatch()
+
+    def stats(self):
+        """Snapshot of queue state and counters for capacity planning."""
+        with self._cond:
+            clients = set(self._requests) | set(self._waiting) | set(self._client_active)
+            return {
+                "max_active": self.max_active,
+                "max_pending": self.max_pending,
+                "max_client_requests": self.max_client_requests,
+                "active": self._active,
+                "queued": self._queued,
+                "admitted_requests": self._admitted,
+                "rejected_requests": {str(k): v for k, v in self._rejected.items()},
+                "processed_documents": self._processed,
+                "avg_wait_seconds": round(self._wait_total / self._processed, 3) if self._processed else 0.0,
+                "avg_service_seconds": round(self._service_total / self._processed, 3) if self._processed else 0.0,
+                "clients": {
+                    client: {
+                        "requests": self._requests.get(client, 0),
+                        "queued": len(self._waiting.get(client, ())),
+                        "active": self._client_active.get(client, 0),
+                    }
+                    for client in clients
+                },
+            }
@@ -1,32 +1,138 @@
 import os
 import re
+import json
+import time
+import heapq
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import Counter, OrderedDict
 import pandas as pd
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
 import logging
-from flask import Flask, request, jsonify, render_template, send_file
-from werkzeug.utils import secure_filename
+from flask import Flask, request, jsonify, render_template, send_file, abort
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.datastructures import FileStorage
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
 from pdfminer.high_level import extract_text
 from flask import send_from_directory
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logging.getLogger("pdfminer").setLevel(logging.ERROR)
+from admission import AdmissionController, Overloaded
+from applog import batch, configure_logging, correlation, document_id, log_event, new_id, parse_sample_rates, record_document
+from artifacts import ArtifactManager
+from prefilter import HEADER_FIELDS, DocumentFilter, extract_header_text, parse_header, student_key
+from search import INDEXED_FIELDS, StudentIndex
+from shadow import ShadowRunner, load_candidates
+from taskqueue import TaskQueue
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 
+# Logging: JSON lines written by a background thread; per-document events are
+# sampled ("event=rate,..."), every upload logs one batch.summary record
+app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO").upper()
+app.config["LOG_SAMPLE_RATES"] = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", "document.processed=0.1"))
+configure_logging(app.config["LOG_LEVEL"], app.config["LOG_SAMPLE_RATES"])
+
 # Define directories
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# Retention for generated files in UPLOAD_FOLDER (TTLs in seconds)
+app.config["ARTIFACT_QUOTA_BYTES"] = int(os.environ.get("ARTIFACT_QUOTA_BYTES", 500 * 1024 * 1024))
+app.config["ARTIFACT_TTL"] = int(os.environ.get("ARTIFACT_TTL", 24 * 60 * 60))
+app.config["INTERMEDIATE_TTL"] = int(os.environ.get("INTERMEDIATE_TTL", 60 * 60))
+app.config["ARTIFACT_SWEEP_INTERVAL"] = int(os.environ.get("ARTIFACT_SWEEP_INTERVAL", 300))
+app.config["COMPRESS_INTERMEDIATE_TEXT"] = os.environ.get("COMPRESS_INTERMEDIATE_TEXT", "0") == "1"
+
+artifacts = ArtifactManager(
+    UPLOAD_FOLDER,
+    quota_bytes=app.config["ARTIFACT_QUOTA_BYTES"],
+    default_ttl=app.config["ARTIFACT_TTL"],
+    ttls={
+        "pdf.txt*": app.config["INTERMEDIATE_TTL"],
+        "*.tmp": app.config["INTERMEDIATE_TTL"],
+        ".partial-*": app.config["INTERMEDIATE_TTL"],
+    },
+    sweep_interval=app.config["ARTIFACT_SWEEP_INTERVAL"],
+    compress_text=app.config["COMPRESS_INTERMEDIATE_TEXT"],
+)
+
+# Downloads can be handed to the front-end server: "x-sendfile" (Apache,
+# lighttpd) or "x-accel-redirect" (nginx, internal location DOWNLOAD_ACCEL_PREFIX
+# aliased to UPLOAD_FOLDER)
+app.config["DOWNLOAD_OFFLOAD"] = os.environ.get("DOWNLOAD_OFFLOAD", "").lower()
+app.config["DOWNLOAD_ACCEL_PREFIX"] = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "/protected-uploads/")
+app.config["USE_X_SENDFILE"] = app.config["DOWNLOAD_OFFLOAD"] == "x-sendfile"
+
+# Only job outputs may be downloaded (never pdf.txt or temporary files)
+JOB_ARTIFACT_PATTERN = re.compile(r"^(output|progression)(_[0-9a-f]{32})?\.xlsx$")
+
+# Student search: each export gets a search index written next to it
+# ("output_<id>.index.json"); the most recently searched ones stay loaded
+app.config["SEARCH_BATCH_CACHE_SIZE"] = int(os.environ.get("SEARCH_BATCH_CACHE_SIZE", 8))
+batch_indexes = OrderedDict()  # workbook name -> StudentIndex
+batch_index_locks = {}  # workbook name -> lock held while its index is loaded
+batch_indexes_guard = threading.Lock()
+
+# Shadow mode: candidate parsers ("stage=module:function,...") run next to the
+# current pipeline on a sample of documents; differences at /shadow/report
+app.config["SHADOW_CANDIDATES"] = os.environ.get("SHADOW_CANDIDATES", "")
+app.config["SHADOW_SAMPLE_RATE"] = float(os.environ.get("SHADOW_SAMPLE_RATE", 0.05))
+app.config["SHADOW_REPORT_PATH"] = os.environ.get("SHADOW_REPORT_PATH") or None
+shadow = ShadowRunner(
+    load_candidates(app.config["SHADOW_CANDIDATES"]),
+    sample_rate=app.config["SHADOW_SAMPLE_RATE"],
+    report_path=app.config["SHADOW_REPORT_PATH"],
+)
+
+# Worker-mode outputs are assembled out of core, this many students per sorted run
+app.config["EXPORT_RUN_SIZE"] = int(os.environ.get("EXPORT_RUN_SIZE", 5000))
+
+# Upload limits (in bytes), overridable through the environment
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", 200 * 1024 * 1024))
+app.config["MAX_FILE_SIZE"] = int(os.environ.get("MAX_FILE_SIZE", 20 * 1024 * 1024))
+# Uploaded PDFs stay in memory up to this size, then spill to SPOOL_DIR
+app.config["SPOOL_MAX_MEMORY"] = int(os.environ.get("SPOOL_MAX_MEMORY", 1024 * 1024))
+app.config["SPOOL_DIR"] = os.environ.get("SPOOL_DIR") or None
+
+# Admission control: concurrent extractions, queued documents, uploads per client
+app.config["MAX_ACTIVE_DOCUMENTS"] = int(os.environ.get("MAX_ACTIVE_DOCUMENTS", os.cpu_count() or 1))
+app.config["MAX_PENDING_DOCUMENTS"] = int(os.environ.get("MAX_PENDING_DOCUMENTS", 64))
+app.config["MAX_CLIENT_REQUESTS"] = int(os.environ.get("MAX_CLIENT_REQUESTS", 2))
+app.config["QUEUE_TIMEOUT"] = float(os.environ.get("QUEUE_TIMEOUT", 60))
+# The controller lives in one process; with several server processes
+# (gunicorn.conf.py sets this to its worker count) each one gets an equal
+# share of the active and pending limits
+app.config["ADMISSION_PROCESSES"] = max(int(os.environ.get("ADMISSION_PROCESSES", 1)), 1)
 
-# Function to extract text from a PDF file
+admission = AdmissionController(
+    max_active=-(-app.config["MAX_ACTIVE_DOCUMENTS"] // app.config["ADMISSION_PROCESSES"]),
+    max_pending=-(-app.config["MAX_PENDING_DOCUMENTS"] // app.config["ADMISSION_PROCESSES"]),
+    max_client_requests=app.config["MAX_CLIENT_REQUESTS"],
+    queue_timeout=app.config["QUEUE_TIMEOUT"],
+)
+
+# Worker mode: when TASK_QUEUE_DIR is set (a directory shared with the worker
+# nodes), uploads are only enqueued and worker.py processes the documents
+app.config["TASK_QUEUE_DIR"] = os.environ.get("TASK_QUEUE_DIR") or None
+app.config["JOB_WAIT_TIMEOUT"] = float(os.environ.get("JOB_WAIT_TIMEOUT", 30))
+task_queue = TaskQueue(app.config["TASK_QUEUE_DIR"]) if app.config["TASK_QUEUE_DIR"] else None
+
+# Jobs (tasks, stored results, payloads) are dropped from the queue after
+# JOB_RETENTION seconds, by the artifact sweeper; by then the output has expired too
+app.config["JOB_RETENTION"] = int(os.environ.get("JOB_RETENTION", app.config["ARTIFACT_TTL"]))
+if task_queue is not None:
+    artifacts.on_sweep = lambda: task_queue.purge(app.config["JOB_RETENTION"])
+
+
+# Function to extract text from a PDF file (path or binary file object)
 def extract_text_from_pdf(file_path):
     text = extract_text(file_path)
-    with open(
-        os.path.join(UPLOAD_FOLDER, "pdf.txt"), "w", encoding="utf-8"
-    ) as output_file:
-        output_file.write(text)
+    artifacts.write_text("pdf.txt", text)
     return text
 
 
@@ -102,7 +208,7 @@ def extract_subject_table(pdf_text):
         end_match = re.search(end_pattern, pdf_text)
         
         if not start_match or not end_match:
-            logging.warning("Could not find subject table boundaries")
+            log_event("document.no_subject_table", "Could not find subject table boundaries", logging.WARNING)
             return subjects
         
         # Extract the subject table content
@@ -111,7 +217,7 @@ def extract_subject_table(pdf_text):
         subject_table_text = pdf_text[start_pos:end_pos]
         
         # Split into lines and clean up
-        lines = [line.strip() for line in subject_table_text.split('\n') if line.strip()]
+        lines = [stripped for line in subject_table_text.split('\n') if (stripped := line.strip())]
         
         # Parse based on the exact MSBTE format
         subjects = parse_msbte_format(lines)
@@ -122,215 +228,149 @@ def extract_subject_table(pdf_text):
     return subjects
 
 
+# Lexer for the subject table: every line is classified exactly once
+LINE_SKIP, LINE_SUBJECT, LINE_MARK = range(3)
+
+MARK_LINE = re.compile(r"[\d\-\s]+")
+SUBJECT_TABLE_HEADERS = frozenset([
+    "MAX", "OBT", "TOTAL", "THEORY", "PRACTICALS", "CREDITS", "SLA",
+    "FA-TH", "SA-TH", "FA-PR", "SA-PR", "OBT MAX OBT",
+])
+
+
+def classify_subject_table_line(line):
+    # Plain numbers and dashes are most of the table; skip the regex for them
+    if line.isdecimal() or line == "-" or MARK_LINE.fullmatch(line):
+        return LINE_MARK
+    if line.isupper() and line not in SUBJECT_TABLE_HEADERS:
+        return LINE_SUBJECT
+    return LINE_SKIP
+
+
+# Parser states and actions: (state, line class) -> (action, next state)
+STATE_IDLE, STATE_NAME, STATE_MARKS = range(3)
+ACTION_NONE, ACTION_START, ACTION_NAME, ACTION_MARK, ACTION_FLUSH_START = range(5)
+
+SUBJECT_TABLE_TRANSITIONS = {
+    (STATE_IDLE, LINE_SKIP): (ACTION_NONE, STATE_IDLE),
+    (STATE_IDLE, LINE_MARK): (ACTION_NONE, STATE_IDLE),  # marks before any subject
+    (STATE_IDLE, LINE_SUBJECT): (ACTION_START, STATE_NAME),
+    (STATE_NAME, LINE_SKIP): (ACTION_NONE, STATE_NAME),
+    (STATE_NAME, LINE_SUBJECT): (ACTION_NAME, STATE_NAME),  # name continuation or grouped subject
+    (STATE_NAME, LINE_MARK): (ACTION_MARK, STATE_MARKS),
+    (STATE_MARKS, LINE_SKIP): (ACTION_NONE, STATE_MARKS),
+    (STATE_MARKS, LINE_MARK): (ACTION_MARK, STATE_MARKS),
+    (STATE_MARKS, LINE_SUBJECT): (ACTION_FLUSH_START, STATE_NAME),
+}
+
+# Marks of grouped subjects (seminar, internship) in MSBTE order:
+# FA-PR Max/Obt, SA-PR Max/Obt, SLA Max/Obt
+GROUPED_SUBJECT_MARKS = [
+    # Subject 1 (ENTREPRENEURSHIP): FA-PR 50/49, SA-PR 25/24, SLA None/None
+    [50, 49, 25, 24, None, None],
+    # Subject 2 (SEMINAR): FA-PR 25/24, SA-PR 25/24, SLA 25/25 (corrected FA-PR Obt and swapped SA-PR)
+    [25, 24, 25, 24, 25, 25],
+    # Subject 3 (INTERNSHIP): FA-PR 100/99, SA-PR 100/96, SLA None/None
+    [100, 99, 100, 96, None, None],
+]
+
+# Positions of the marks of one subject (MSBTE standard order)
+SUBJECT_MARK_KEYS = [
+    "fa_th_max", "fa_th_obt", "sa_th_max", "sa_th_obt", "th_total_max", "th_total_obt",
+    "fa_pr_max", "fa_pr_obt", "sa_pr_max", "sa_pr_obt", "sla_max", "sla_obt", "credits",
+]
+
+
+def flush_subject_group(names, marks, all_subjects_data):
+    """Emit the subject(s) collected so far with their marks."""
+    if len(names) == 1:
+        # Single subject with marks
+        all_subjects_data.append({'name': names[0], 'marks': marks})
+        return
+
+    # Multiple subjects - create separate entries with the known MSBTE marks
+    # Full 13-position array: 6 None (theory) + 6 practical + 1 credits
+    for j, subject_name in enumerate(names):
+        if len(names) >= 3 and j < len(GROUPED_SUBJECT_MARKS):
+            subject_marks_slice = GROUPED_SUBJECT_MARKS[j]
+        else:
+            subject_marks_slice = [None] * 6
+        all_subjects_data.append({
+            'name': subject_name,
+            'marks': [None] * 6 + subject_marks_slice + [None],
+        })
+
+
 def parse_msbte_format(lines):
     """
     Parse MSBTE marksheet format based on actual interleaved structure.
     Each subject is followed by its own marks in a row.
     Handles multi-line subject names and grouped subjects.
+
+    Lines are classified once (classify_subject_table_line) and fed through
+    the SUBJECT_TABLE_TRANSITIONS state machine.
     """
     subjects = []
-    
+
     try:
         # The actual structure is:
         # Headers -> Subject1 -> Marks1 -> Subject2 -> Marks2 -> etc.
         # Some subject names span multiple lines
         # Some subjects are grouped together (seminar, internship)
-        
+
         if len(lines) < 25:
             return subjects
-        
-        # Find all subjects and their marks (handling multi-line and grouped subjects)
-        current_subjects = []  # Can hold multiple subjects for grouped case
-        subject_marks = []
+
+        names = []  # Can hold multiple subjects for grouped case
+        marks = []
         all_subjects_data = []
-        
-        for i, line in enumerate(lines):
-            # Check if this is a subject name (including multi-line)
-            if (line.isupper() and 
-                len(line.split()) > 0 and 
-                not re.match(r'^[\d\-\s]+$', line) and
-                line not in ['MAX', 'OBT', 'TOTAL', 'THEORY', 'PRACTICALS', 'CREDITS', 'SLA', 'FA-TH', 'SA-TH', 'FA-PR', 'SA-PR', 'OBT MAX OBT']):
-                
-                # Check if this is a continuation or new subject
-                if len(current_subjects) == 0:
-                    # Start new subject/group
-                    current_subjects.append(line)
-                    subject_marks = []
-                elif len(subject_marks) == 0:
-                    # No marks yet, this is continuation of current subject name OR new subject in group
-                    if len(current_subjects) == 1:
-                        current_subject = current_subjects[0]
-                        # Check if this is a continuation of the same subject
-                        if current_subject.endswith(' AND ') or current_subject.endswith('DEVELOPMENT AND'):
-                            # Likely continuation (e.g., "ENTREPRENEURSHIP DEVELOPMENT AND" + "STARTUPS")
-                            current_subjects[0] = current_subject + " " + line
-                        else:
-                            # New subject in group
-                            current_subjects.append(line)
-                    else:
-                        # Multiple subjects, add as new subject
-                        current_subjects.append(line)
+        state = STATE_IDLE
+
+        for line in lines:
+            action, state = SUBJECT_TABLE_TRANSITIONS[state, classify_subject_table_line(line)]
+
+            if action == ACTION_MARK:
+                marks.append(int(line) if line.isdecimal() else parse_numeric(line.strip()))
+            elif action == ACTION_NAME:
+                # No marks yet: continuation of the subject name (e.g.
+                # "ENTREPRENEURSHIP DEVELOPMENT AND" + "STARTUPS") or a new
+                # subject in a group
+                if len(names) == 1 and (names[0].endswith(' AND ') or names[0].endswith('DEVELOPMENT AND')):
+                    names[0] = names[0] + " " + line
                 else:
-                    # We have marks, so this is a new subject/group
-                    # Save previous subject(s)
-                    if len(current_subjects) == 1:
-                        # Single subject with marks
-                        all_subjects_data.append({
-                            'name': current_subjects[0],
-                            'marks': subject_marks.copy()
-                        })
-                    else:
-                        # Multiple subjects - create separate entries with distributed marks
-                        # For special subjects, distribute marks according to actual MSBTE structure
-                        num_subjects = len(current_subjects)
-                        
-                        # Extract only the actual marks (skip initial theory dashes)
-                        practical_marks_start = 18  # Skip 18 theory dashes
-                        practical_marks = subject_marks[practical_marks_start:]
-                        
-                        # Manual mapping based on user feedback and actual marksheet structure
-                        subject_mappings = []
-                        
-                        if num_subjects >= 3:
-                            # Subject 1 (ENTREPRENEURSHIP): FA-PR 50/49, SA-PR 25/24, SLA None/None
-                            subject_mappings.append([50, 49, 25, 24, None, None])
-                            
-                            # Subject 2 (SEMINAR): FA-PR 25/24, SA-PR 25/24, SLA 25/25 (corrected FA-PR Obt and swapped SA-PR)
-                            subject_mappings.append([25, 24, 25, 24, 25, 25])
-                            
-                            # Subject 3 (INTERNSHIP): FA-PR 100/99, SA-PR 100/96, SLA None/None
-                            subject_mappings.append([100, 99, 100, 96, None, None])
-                        
-                        for j, subject_name in enumerate(current_subjects):
-                            if j < len(subject_mappings):
-                                subject_marks_slice = subject_mappings[j]
-                            else:
-                                subject_marks_slice = [None] * 6
-                            
-                            # Create full 13-position array: 6 None (theory) + 6 practical + 1 credits
-                            padded_marks = [None] * 6 + subject_marks_slice + [None]
-                            
-                            all_subjects_data.append({
-                                'name': subject_name,
-                                'marks': padded_marks
-                            })
-                    
-                    # Start new subject/group
-                    current_subjects = [line]
-                    subject_marks = []
-            
-            # Check if this is a mark
-            elif re.match(r'^[\d\-\s]+$', line) and current_subjects:
-                clean_mark = parse_numeric(line.strip())
-                subject_marks.append(clean_mark)
-        
+                    names.append(line)
+            elif action == ACTION_FLUSH_START:
+                flush_subject_group(names, marks, all_subjects_data)
+                names = [line]
+                marks = []
+            elif action == ACTION_START:
+                names = [line]
+                marks = []
+
         # Save the last subject(s)
-        if current_subjects and subject_marks:
-            if len(current_subjects) == 1:
-                # Single subject with marks
-                all_subjects_data.append({
-                    'name': current_subjects[0],
-                    'marks': subject_marks.copy()
-                })
-            else:
-                # Multiple subjects - create separate entries with distributed marks
-                # For special subjects, distribute marks according to actual MSBTE structure
-                num_subjects = len(current_subjects)
-                
-                # Extract only the actual marks (skip initial theory dashes)
-                practical_marks_start = 18  # Skip 18 theory dashes
-                practical_marks = subject_marks[practical_marks_start:]
-                
-                # Manual mapping based on user feedback and actual marksheet structure
-                subject_mappings = []
-                
-                if num_subjects >= 3:
-                    # Subject 1 (ENTREPRENEURSHIP): FA-PR 50/49, SA-PR 25/24, SLA None/None
-                    subject_mappings.append([50, 49, 25, 24, None, None])
-                    
-                    # Subject 2 (SEMINAR): FA-PR 25/24, SA-PR 25/24, SLA 25/25 (corrected FA-PR Obt and swapped SA-PR)
-                    subject_mappings.append([25, 24, 25, 24, 25, 25])
-                    
-                    # Subject 3 (INTERNSHIP): FA-PR 100/99, SA-PR 100/96, SLA None/None
-                    subject_mappings.append([100, 99, 100, 96, None, None])
-                
-                for j, subject_name in enumerate(current_subjects):
-                    if j < len(subject_mappings):
-                        subject_marks_slice = subject_mappings[j]
-                    else:
-                        subject_marks_slice = [None] * 6
-                    
-                    # Create full 13-position array: 6 None (theory) + 6 practical + 1 credits
-                    padded_marks = [None] * 6 + subject_marks_slice + [None]
-                    
-                    all_subjects_data.append({
-                        'name': subject_name,
-                        'marks': padded_marks
-                    })
-        
-        print(f"DEBUG: Found {len(all_subjects_data)} subjects with interleaved marks:")
-        for i, subj_data in enumerate(all_subjects_data):
-            print(f"  {i}: {subj_data['name']} - {len(subj_data['marks'])} marks")
-        
-        # Now process each subject's marks
+        if state == STATE_MARKS:
+            flush_subject_group(names, marks, all_subjects_data)
+
+        logging.debug(f"Found {len(all_subjects_data)} subjects with interleaved marks")
+
+        # Map marks to fields by position; values are taken in (max, obt)
+        # pairs, so an unpaired trailing mark is left out
         for subj_data in all_subjects_data:
-            subject_name = subj_data['name']
+            subject_marks = {"subject_name": subj_data['name'].strip()}
+            subject_marks.update(dict.fromkeys(SUBJECT_MARK_KEYS))
+
             marks = subj_data['marks']
-            
-            subject_marks = {
-                "subject_name": subject_name.strip(),
-                "fa_th_max": None,
-                "fa_th_obt": None,
-                "sa_th_max": None,
-                "sa_th_obt": None,
-                "th_total_max": None,
-                "th_total_obt": None,
-                "fa_pr_max": None,
-                "fa_pr_obt": None,
-                "sa_pr_max": None,
-                "sa_pr_obt": None,
-                "sla_max": None,
-                "sla_obt": None,
-                "credits": None
-            }
-            
-            # Map marks based on position (MSBTE standard order)
-            # Expected order: FA-TH Max, FA-TH Obt, SA-TH Max, SA-TH Obt, 
-            # TH Total Max, TH Total Obt, FA-PR Max, FA-PR Obt, 
-            # SA-PR Max, SA-PR Obt, SLA Max, SLA Obt, Credits
-            
-            if len(marks) >= 2:
-                subject_marks["fa_th_max"] = marks[0] if len(marks) > 0 else None
-                subject_marks["fa_th_obt"] = marks[1] if len(marks) > 1 else None
-            
-            if len(marks) >= 4:
-                subject_marks["sa_th_max"] = marks[2] if len(marks) > 2 else None
-                subject_marks["sa_th_obt"] = marks[3] if len(marks) > 3 else None
-            
-            if len(marks) >= 6:
-                subject_marks["th_total_max"] = marks[4] if len(marks) > 4 else None
-                subject_marks["th_total_obt"] = marks[5] if len(marks) > 5 else None
-            
-            if len(marks) >= 8:
-                subject_marks["fa_pr_max"] = marks[6] if len(marks) > 6 else None
-                subject_marks["fa_pr_obt"] = marks[7] if len(marks) > 7 else None
-            
-            if len(marks) >= 10:
-                subject_marks["sa_pr_max"] = marks[8] if len(marks) > 8 else None
-                subject_marks["sa_pr_obt"] = marks[9] if len(marks) > 9 else None
-            
-            if len(marks) >= 12:
-                subject_marks["sla_max"] = marks[10] if len(marks) > 10 else None
-                subject_marks["sla_obt"] = marks[11] if len(marks) > 11 else None
-            
+            paired = min(len(marks) // 2, 6) * 2
+            for key, value in zip(SUBJECT_MARK_KEYS[:paired], marks):
+                subject_marks[key] = value
             if len(marks) >= 13:
-                subject_marks["credits"] = marks[12] if len(marks) > 12 else None
-            
+                subject_marks["credits"] = marks[12]
+
             subjects.append(subject_marks)
-            
+
     except Exception as e:
         logging.error(f"Error parsing MSBTE format: {str(e)}")
-    
+
     return subjects
 
 
@@ -688,98 +728,468 @@ def parse_marksheet(text):
     return result_data
 
 
+# Column layout and dtypes of the exported tables. Marks are nullable
+# integers and repeated labels are categoricals, so sorting and filtering
+# are vectorized instead of comparing Python strings.
+SEMESTERS = ["FIRST", "SECOND", "THIRD", "FOURTH", "FIFTH", "SIXTH"]
+RESULTS = ["FAIL", "PASS", "SECOND CLASS", "FIRST CLASS", "FIRST CLASS DIST"]
+STUDENT_YEARS = ["First Year", "Second Year", "Third Year", "Unknown"]
+
+SUMMARY_COLUMNS = [
+    "Student Name", "Enrollment No", "Examination", "Seat No", "Semester",
+    "Percentage", "Gain Marks", "Total Marks", "Total Credits",
+    "Student Year", "Result",
+]
+SUMMARY_DTYPES = {
+    "Examination": "category",
+    "Semester": pd.CategoricalDtype(SEMESTERS, ordered=True),
+    "Percentage": "Float64",
+    "Gain Marks": "Int64",
+    "Total Marks": "Int64",
+    "Total Credits": "Int64",
+    "Student Year": pd.CategoricalDtype(STUDENT_YEARS, ordered=True),
+    "Result": pd.CategoricalDtype(RESULTS, ordered=True),
+}
+SUMMARY_SORT_COLUMNS = ["Percentage", "Gain Marks"]
+
+# Subject Marks sheet: column -> key in the extract_subject_table dicts
+SUBJECT_MARK_FIELDS = {
+    "FA-TH Max": "fa_th_max",
+    "FA-TH Obt": "fa_th_obt",
+    "SA-TH Max": "sa_th_max",
+    "SA-TH Obt": "sa_th_obt",
+    "TH Total Max": "th_total_max",
+    "TH Total Obt": "th_total_obt",
+    "FA-PR Max": "fa_pr_max",
+    "FA-PR Obt": "fa_pr_obt",
+    "SA-PR Max": "sa_pr_max",
+    "SA-PR Obt": "sa_pr_obt",
+    "SLA Max": "sla_max",
+    "SLA Obt": "sla_obt",
+    "Credits": "credits",
+}
+SUBJECT_COLUMNS = ["Enrollment No", "Semester", "Subject Name"] + list(SUBJECT_MARK_FIELDS)
+SUBJECT_DTYPES = {
+    "Semester": pd.CategoricalDtype(SEMESTERS, ordered=True),
+    "Subject Name": "category",
+    **{column: "Int64" for column in SUBJECT_MARK_FIELDS},
+}
+
+
+def apply_dtypes(df, dtypes):
+    """Cast the columns of df that appear in dtypes; unparseable values become <NA>."""
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        if dtype in ("Int64", "Float64"):
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def build_summary_frame(data_list):
+    """Student Summary table (one row per student, subjects left out)."""
+    extra_columns = []
+    for student_data in data_list:
+        for key in student_data:
+            if key not in SUMMARY_COLUMNS and key != "subjects" and key not in extra_columns:
+                extra_columns.append(key)
+
+    columns = SUMMARY_COLUMNS + extra_columns
+    df_summary = pd.DataFrame(
+        {column: [student_data.get(column) for student_data in data_list] for column in columns},
+        columns=columns,
+    )
+    return apply_dtypes(df_summary, SUMMARY_DTYPES)
+
+
+def sort_summary_frame(df_summary):
+    return df_summary.sort_values(by=SUMMARY_SORT_COLUMNS, ascending=False, kind="stable")
+
+
+def build_subject_frame(data_list):
+    """Subject Marks table (one row per student and subject)."""
+    columns = {column: [] for column in SUBJECT_COLUMNS}
+
+    for student_data in data_list:
+        enrollment_no = student_data.get("Enrollment No", "")
+        semester = student_data.get("Semester", "")
+
+        # If no subjects were extracted, still create a placeholder row
+        subjects = student_data.get("subjects") or [{"subject_name": "No subject data available"}]
+
+        for subject in subjects:
+            columns["Enrollment No"].append(enrollment_no)
+            columns["Semester"].append(semester)
+            columns["Subject Name"].append(subject.get("subject_name", ""))
+            for column, key in SUBJECT_MARK_FIELDS.items():
+                columns[column].append(subject.get(key))
+
+    return apply_dtypes(pd.DataFrame(columns, columns=SUBJECT_COLUMNS), SUBJECT_DTYPES)
+
+
 # Function to save data to Excel with two sheets
 def save_to_excel(data_list, output_file):
     """
     Save student data to Excel with two sheets:
-    Sheet 1: Student Summary (existing format)
-    Sheet 2: Subject Marks (new format)
+    Sheet 1: Student Summary, sorted by Percentage then Gain Marks
+    Sheet 2: Subject Marks
+    Returns the Student Summary table.
     """
+    df_summary = sort_summary_frame(build_summary_frame(data_list))
+    df_subjects = build_subject_frame(data_list)
+
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        # Sheet 1: Student Summary (unchanged format, but without subjects field)
-        summary_data = []
-        for student_data in data_list:
-            # Create a copy without the subjects field for the summary sheet
-            summary_row = student_data.copy()
-            if 'subjects' in summary_row:
-                del summary_row['subjects']
-            summary_data.append(summary_row)
-        
-        df_summary = pd.DataFrame(summary_data)
-        
-        # Ensure sorting columns exist before applying sort
-        sort_columns = [col for col in ["Percentage", "Gain Marks"] if col in df_summary.columns]
-        
-        if sort_columns:
-            df_summary = df_summary.sort_values(by=sort_columns, ascending=False)
-        
         df_summary.to_excel(writer, sheet_name="Student Summary", index=False)
-        
-        # Sheet 2: Subject Marks
-        subject_rows = []
-        
-        for student_data in data_list:
-            enrollment_no = student_data.get("Enrollment No", "")
-            semester = student_data.get("Semester", "")
-            
-            # Get subject data if available
-            subjects = student_data.get("subjects", [])
-            
-            if subjects:
-                for subject in subjects:
-                    subject_row = {
-                        "Enrollment No": enrollment_no,
-                        "Semester": semester,
-                        "Subject Name": subject.get("subject_name", ""),
-                        "FA-TH Max": subject.get("fa_th_max"),
-                        "FA-TH Obt": subject.get("fa_th_obt"),
-                        "SA-TH Max": subject.get("sa_th_max"),
-                        "SA-TH Obt": subject.get("sa_th_obt"),
-                        "TH Total Max": subject.get("th_total_max"),
-                        "TH Total Obt": subject.get("th_total_obt"),
-                        "FA-PR Max": subject.get("fa_pr_max"),
-                        "FA-PR Obt": subject.get("fa_pr_obt"),
-                        "SA-PR Max": subject.get("sa_pr_max"),
-                        "SA-PR Obt": subject.get("sa_pr_obt"),
-                        "SLA Max": subject.get("sla_max"),
-                        "SLA Obt": subject.get("sla_obt"),
-                        "Credits": subject.get("credits")
-                    }
-                    subject_rows.append(subject_row)
-            else:
-                # If no subjects extracted, still create a placeholder row
-                subject_row = {
-                    "Enrollment No": enrollment_no,
-                    "Semester": semester,
-                    "Subject Name": "No subject data available",
-                    "FA-TH Max": None,
-                    "FA-TH Obt": None,
-                    "SA-TH Max": None,
-                    "SA-TH Obt": None,
-                    "TH Total Max": None,
-                    "TH Total Obt": None,
-                    "FA-PR Max": None,
-                    "FA-PR Obt": None,
-                    "SA-PR Max": None,
-                    "SA-PR Obt": None,
-                    "SLA Max": None,
-                    "SLA Obt": None,
-                    "Credits": None
-                }
-                subject_rows.append(subject_row)
-        
-        if subject_rows:
-            df_subjects = pd.DataFrame(subject_rows)
-            df_subjects.to_excel(writer, sheet_name="Subject Marks", index=False)
-        else:
-            # Create empty sheet with headers if no subject data
-            empty_df = pd.DataFrame(columns=[
-                "Enrollment No", "Semester", "Subject Name",
-                "FA-TH Max", "FA-TH Obt", "SA-TH Max", "SA-TH Obt",
-                "TH Total Max", "TH Total Obt", "FA-PR Max", "FA-PR Obt",
-                "SA-PR Max", "SA-PR Obt", "SLA Max", "SLA Obt", "Credits"
-            ])
-            empty_df.to_excel(writer, sheet_name="Subject Marks", index=False)
+        df_subjects.to_excel(writer, sheet_name="Subject Marks", index=False)
+    return df_summary
+
+
+# Out-of-core export for batches that do not fit in memory
+class BatchAssembler:
+    """
+    Builds the same two-sheet workbook as save_to_excel while holding at most
+    `run_size` students in memory:
+
+    - records are buffered, typed and sorted run_size at a time and spilled to
+      disk as sorted runs; their subject rows are spilled in arrival order
+    - write_excel() k-way merges the runs on Percentage / Gain Marks (same
+      order as sort_summary_frame) and streams both sheets to a write-only
+      openpyxl workbook
+    """
+
+    def __init__(self, run_size=5000, spill_dir=None):
+        self.run_size = run_size
+        self.spill_dir = tempfile.mkdtemp(prefix="export-", dir=spill_dir)
+        self._buffer = []
+        self._runs = []
+        self._summary_columns = list(SUMMARY_COLUMNS)
+        self._subject_path = os.path.join(self.spill_dir, "subjects.jsonl")
+        self._subject_file = open(self._subject_path, "w", encoding="utf-8")
+        self._seq = 0
+
+    def add(self, student_data):
+        self._buffer.append(student_data)
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffer:
+            return
+
+        df_summary = build_summary_frame(self._buffer)
+        for column in df_summary.columns:
+            if column not in self._summary_columns:
+                self._summary_columns.append(column)
+
+        # Arrival order breaks ties, so the merge is as stable as one big sort
+        df_summary["_seq"] = range(self._seq, self._seq + len(df_summary))
+        self._seq += len(df_summary)
+
+        run_path = os.path.join(self.spill_dir, f"run-{len(self._runs)}.jsonl")
+        with open(run_path, "w", encoding="utf-8") as run_file:
+            for record in frame_records(sort_summary_frame(df_summary)):
+                run_file.write(json.dumps(record) + "\n")
+        self._runs.append(run_path)
+
+        for record in frame_records(build_subject_frame(self._buffer)):
+            self._subject_file.write(json.dumps(record) + "\n")
+
+        self._buffer = []
+
+    @staticmethod
+    def _sort_key(record):
+        # Descending Percentage then Gain Marks, missing values last
+        key = []
+        for column in SUMMARY_SORT_COLUMNS:
+            value = record.get(column)
+            key += [value is None, -(value or 0)]
+        key.append(record["_seq"])
+        return key
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, encoding="utf-8") as run_file:
+            for line in run_file:
+                yield json.loads(line)
+
+    def write_excel(self, output_file, index=None):
+        """Write the workbook; Student Summary rows are also added to `index` if given."""
+        self._spill()
+        self._subject_file.close()
+
+        workbook = openpyxl.Workbook(write_only=True)
+
+        sheet = workbook.create_sheet("Student Summary")
+        sheet.append(self._summary_columns)
+        runs = [self._read_run(path) for path in self._runs]
+        for record in heapq.merge(*runs, key=self._sort_key):
+            sheet.append([record.get(column) for column in self._summary_columns])
+            if index is not None:
+                index.add_many([record])
+
+        sheet = workbook.create_sheet("Subject Marks")
+        sheet.append(SUBJECT_COLUMNS)
+        for record in self._read_run(self._subject_path):
+            sheet.append([record.get(column) for column in SUBJECT_COLUMNS])
+
+        workbook.save(output_file)
+
+    def close(self):
+        if not self._subject_file.closed:
+            self._subject_file.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+# Incremental mode: merge newly parsed marksheets into an exported workbook
+def append_to_excel(existing_workbook, data_list, output_file):
+    """
+    Replace the rows of students present in data_list (same Enrollment No and
+    Semester) in an existing workbook and add the rest, keeping the Student
+    Summary sort order. Only the new documents are parsed; the existing rows
+    are copied as they are.
+
+    Subject Marks rows of new and replaced students are appended at the end,
+    so that sheet's row order can differ from a full re-upload of the same
+    PDFs (its contents do not). Returns the merged Student Summary table.
+    """
+    old_summary, old_subjects = read_exported_workbook(existing_workbook)
+    new_summary = build_summary_frame(data_list)
+    new_subjects = build_subject_frame(data_list)
+
+    replaced = set(zip(new_summary["Enrollment No"], new_summary["Semester"].astype(object)))
+
+    def keep_rows(df):
+        keys = zip(df["Enrollment No"], df["Semester"].astype(object))
+        return df[[key not in replaced for key in keys]]
+
+    # Both parts are already sorted, so the stable sort is a single merge pass
+    df_summary = sort_summary_frame(
+        apply_dtypes(pd.concat([keep_rows(old_summary), sort_summary_frame(new_summary)], ignore_index=True), SUMMARY_DTYPES)
+    )
+    df_subjects = apply_dtypes(pd.concat([keep_rows(old_subjects), new_subjects], ignore_index=True), SUBJECT_DTYPES)
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        df_summary.to_excel(writer, sheet_name="Student Summary", index=False)
+        df_subjects.to_excel(writer, sheet_name="Subject Marks", index=False)
+    return df_summary
+
+
+class InvalidWorkbook(ValueError):
+    """An uploaded .xlsx that is not a workbook exported by save_to_excel."""
+
+
+EXPORTED_SHEETS = {"Student Summary": SUMMARY_COLUMNS, "Subject Marks": SUBJECT_COLUMNS}
+
+
+# Cheap check of an uploaded workbook (sheet names only) before any PDF is processed
+def check_exported_workbook(stream):
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True)
+        sheet_names = workbook.sheetnames
+        workbook.close()
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, ValueError, OSError) as e:
+        raise InvalidWorkbook(f"Not a valid Excel workbook: {str(e)}") from e
+    finally:
+        stream.seek(0)
+
+    missing = [name for name in EXPORTED_SHEETS if name not in sheet_names]
+    if missing:
+        raise InvalidWorkbook(f"Not an exported marksheet workbook (missing sheet '{missing[0]}')")
+
+
+# Read back a workbook written by save_to_excel (for merging later batches)
+def read_exported_workbook(source):
+    try:
+        sheets = pd.read_excel(
+            source,
+            sheet_name=list(EXPORTED_SHEETS),
+            dtype={"Enrollment No": str, "Seat No": str},
+            engine="openpyxl",
+        )
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, ValueError, OSError) as e:
+        raise InvalidWorkbook(f"Not an exported marksheet workbook: {str(e)}") from e
+
+    for name, columns in EXPORTED_SHEETS.items():
+        missing = [column for column in columns if column not in sheets[name].columns]
+        if missing:
+            raise InvalidWorkbook(f"Sheet '{name}' is missing the '{missing[0]}' column")
+
+    df_summary = apply_dtypes(sheets["Student Summary"], SUMMARY_DTYPES)
+    df_subjects = apply_dtypes(sheets["Subject Marks"], SUBJECT_DTYPES)
+    return df_summary, df_subjects
+
+
+# A subject counts as failed when any head scores below this share of its maximum
+PASS_MARK_FRACTION = 0.4
+SUBJECT_HEADS = [
+    ("FA-TH Max", "FA-TH Obt"),
+    ("SA-TH Max", "SA-TH Obt"),
+    ("FA-PR Max", "FA-PR Obt"),
+    ("SA-PR Max", "SA-PR Obt"),
+    ("SLA Max", "SLA Obt"),
+]
+SEASONS = {"SUMMER": 0, "WINTER": 1}
+
+
+def exam_order(examination):
+    """Sort key for "WINTER 2024" style exam names (unknown names sort first)."""
+    match = re.match(r"([A-Z]+)\s+(\d{4})", str(examination))
+    if not match:
+        return (0, -1)
+    return (int(match.group(2)), SEASONS.get(match.group(1), -1))
+
+
+def subject_failed_mask(df_subjects):
+    """Boolean Series: True for subject rows with a head below the pass mark."""
+    failed = pd.Series(False, index=df_subjects.index)
+    for max_column, obt_column in SUBJECT_HEADS:
+        below = df_subjects[obt_column] < df_subjects[max_column] * PASS_MARK_FRACTION
+        failed |= below.fillna(False).astype(bool)
+    return failed
+
+
+# Merge results of several semesters/exams into one row per student
+def build_progression_table(df_summary, df_subjects):
+    """
+    Hash-join summary and subject rows on Enrollment No (one pass over each
+    table) and build a wide progression table: percentage, credits and failed
+    subjects per semester, total credits earned and subjects carried over.
+
+    When a semester was attempted more than once, the latest exam counts for
+    the summary columns; re-uploads of the same exam are not extra attempts.
+    Subject rows carry no exam name, so they are taken in input order
+    (earlier batches first): a subject is carried over when its last
+    occurrence is still failed.
+    """
+    # Failed subjects per (student, semester), and the latest outcome per subject
+    ever_failed = {}
+    last_outcome = {}
+    subject_keys = df_subjects[["Enrollment No", "Semester", "Subject Name"]].itertuples(index=False)
+    for (enrollment_no, semester, subject_name), failed in zip(subject_keys, subject_failed_mask(df_subjects)):
+        if failed:
+            ever_failed.setdefault((enrollment_no, semester), set()).add(subject_name)
+        last_outcome[(enrollment_no, semester, subject_name)] = failed
+
+    carried_over = {}
+    for (enrollment_no, semester, subject_name), failed in last_outcome.items():
+        if failed:
+            carried_over.setdefault(enrollment_no, []).append(subject_name)
+
+    # Students keyed by Enrollment No, with their attempts by semester
+    students = {}
+    for row in df_summary.to_dict("records"):
+        enrollment_no = row["Enrollment No"]
+        if pd.isna(enrollment_no) or row["Semester"] not in SEMESTERS:
+            continue
+        student = students.setdefault(enrollment_no, {"name": row["Student Name"], "attempts": {}})
+        # The same exam uploaded twice is one attempt (the later copy wins)
+        student["attempts"].setdefault(row["Semester"], {})[row["Examination"]] = row
+
+    rows = []
+    semesters_seen = set()
+    for enrollment_no, student in students.items():
+        record = {"Student Name": student["name"], "Enrollment No": enrollment_no}
+        credits_earned = 0
+        failed_total = 0
+
+        for semester in SEMESTERS:
+            if semester not in student["attempts"]:
+                continue
+            attempts = list(student["attempts"][semester].values())
+            semesters_seen.add(semester)
+
+            latest = max(attempts, key=lambda attempt: exam_order(attempt["Examination"]))
+            failed_count = len(ever_failed.get((enrollment_no, semester), ()))
+            failed_total += failed_count
+            if not pd.isna(latest["Total Credits"]):
+                credits_earned += latest["Total Credits"]
+
+            record[f"{semester} Percentage"] = latest["Percentage"]
+            record[f"{semester} Credits"] = latest["Total Credits"]
+            record[f"{semester} Result"] = latest["Result"]
+            record[f"{semester} Failed Subjects"] = failed_count
+            record[f"{semester} Attempts"] = len(attempts)
+            record["Latest Semester"] = semester
+            record["Latest Result"] = latest["Result"]
+
+        record["Credits Earned"] = credits_earned
+        record["Subjects Failed"] = failed_total
+        record["Carried Over"] = "; ".join(carried_over.get(enrollment_no, []))
+        rows.append(record)
+
+    columns = ["Student Name", "Enrollment No"]
+    for semester in SEMESTERS:
+        if semester in semesters_seen:
+            columns += [
+                f"{semester} Percentage", f"{semester} Credits", f"{semester} Result",
+                f"{semester} Failed Subjects", f"{semester} Attempts",
+            ]
+    columns += ["Credits Earned", "Subjects Failed", "Carried Over", "Latest Semester", "Latest Result"]
+
+    df_progression = pd.DataFrame(rows, columns=columns)
+    dtypes = {"Latest Semester": SUMMARY_DTYPES["Semester"], "Latest Result": SUMMARY_DTYPES["Result"]}
+    for semester in semesters_seen:
+        dtypes[f"{semester} Percentage"] = "Float64"
+        dtypes[f"{semester} Credits"] = "Int64"
+        dtypes[f"{semester} Result"] = SUMMARY_DTYPES["Result"]
+    return apply_dtypes(df_progression, dtypes).sort_values("Enrollment No", kind="stable")
+
+
+# Documents handled by this process (gunicorn.conf.py recycles workers on it)
+processed_documents = 0
+
+
+# Full pipeline for one marksheet: text extraction, header parsing, subject table
+def process_pdf(source, filename=None):
+    global processed_documents
+    processed_documents += 1
+
+    with correlation(document=document_id.get() or new_id()):
+        timings = {}
+        started = time.perf_counter()
+        pdf_text = extract_text(source)
+        timings["extract_text"] = time.perf_counter() - started
+        # Kept out of the timing: the shadow candidate is compared on extraction alone
+        artifacts.write_text("pdf.txt", pdf_text)
+
+        started = time.perf_counter()
+        parsed_data = parse_marksheet(pdf_text)
+        timings["parse_marksheet"] = time.perf_counter() - started
+
+        # Extract subject-wise marks
+        started = time.perf_counter()
+        failed = False
+        try:
+            parsed_data["subjects"] = extract_subject_table(pdf_text)
+        except Exception as e:
+            log_event(
+                "document.subjects_failed", f"Failed to extract subjects: {str(e)}", logging.WARNING,
+                file=filename, enrollment_no=parsed_data.get("Enrollment No"),
+            )
+            parsed_data["subjects"] = []
+            failed = True
+        timings["extract_subject_table"] = time.perf_counter() - started
+
+        record_document(timings, len(parsed_data["subjects"]), failed)
+        log_event(
+            "document.processed", "Processed marksheet",
+            file=filename, enrollment_no=parsed_data.get("Enrollment No"),
+            subjects=len(parsed_data["subjects"]),
+            stage_seconds={stage: round(seconds, 4) for stage, seconds in timings.items()},
+        )
+
+        if shadow.should_sample():
+            baseline = {
+                "extract_text": pdf_text,
+                "parse_marksheet": {key: value for key, value in parsed_data.items() if key != "subjects"},
+                "extract_subject_table": parsed_data["subjects"],
+            }
+            document = {"file": filename or str(source), "enrollment_no": parsed_data.get("Enrollment No")}
+            shadow.submit(document, source, pdf_text, baseline, timings)
+
+    return parsed_data
 
 
 # Allow only PDF files
@@ -787,6 +1197,112 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() == "pdf"
 
 
+# Run the retention sweeper in every serving process (including forked workers)
+@app.before_request
+def start_artifact_sweeper():
+    artifacts.ensure_sweeper()
+
+
+# Stream multipart parts from the request body as each one completes
+def iter_upload_parts(chunk_size=64 * 1024):
+    """
+    Incrementally decode a multipart/form-data request body.
+
+    Yields ("field", name, value) for form fields and ("file", name, FileStorage)
+    for files as soon as each part has been fully received, so callers can start
+    processing the first PDF while the rest of the upload is still arriving.
+    File parts are spooled in memory up to SPOOL_MAX_MEMORY and to disk beyond,
+    and each one is capped at MAX_FILE_SIZE (the whole body at MAX_CONTENT_LENGTH).
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        return
+
+    max_file_size = app.config["MAX_FILE_SIZE"]
+    decoder = MultipartDecoder(
+        boundary.encode("latin-1"),
+        max_form_memory_size=request.max_form_memory_size,
+        max_parts=request.max_form_parts,
+    )
+    stream = request.stream
+    current_part = None
+    container = None
+    part_size = 0
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    current_part = event
+                    container = []
+                elif isinstance(event, File):
+                    current_part = event
+                    part_size = 0
+                    container = tempfile.SpooledTemporaryFile(
+                        max_size=app.config["SPOOL_MAX_MEMORY"],
+                        dir=app.config["SPOOL_DIR"],
+                    )
+                elif isinstance(event, Data):
+                    if isinstance(current_part, Field):
+                        container.append(event.data)
+                        if not event.more_data:
+                            value = b"".join(container).decode("utf-8", "replace")
+                            yield "field", current_part.name, value
+                    else:
+                        part_size += len(event.data)
+                        if max_file_size is not None and part_size > max_file_size:
+                            container.close()
+                            raise RequestEntityTooLarge(
+                                f"File '{current_part.filename}' exceeds the {max_file_size} byte limit"
+                            )
+                        container.write(event.data)
+                        if not event.more_data:
+                            container.seek(0)
+                            spooled, container = container, None
+                            yield "file", current_part.name, FileStorage(
+                                spooled,
+                                current_part.filename,
+                                current_part.name,
+                                headers=current_part.headers,
+                            )
+
+                event = decoder.next_event()
+
+            if not chunk or isinstance(event, Epilogue):
+                break
+    except ValueError as e:
+        # Truncated or malformed body: drop the part being received
+        if container is not None and not isinstance(container, list):
+            container.close()
+        raise BadRequest(f"Malformed multipart body: {str(e)}") from e
+
+
+# Filters requested with an upload (form fields sent before the files), or None
+def build_document_filter(form, existing_workbook=None):
+    doc_filter = DocumentFilter.from_form(form)
+    if doc_filter is not None and doc_filter.skip_duplicates and existing_workbook is not None:
+        # Students already in the workbook being appended to count as duplicates
+        df_summary, _ = read_exported_workbook(existing_workbook.stream)
+        existing_workbook.stream.seek(0)
+        doc_filter.seen_keys.update(filter(None, map(student_key, frame_records(df_summary))))
+    return doc_filter
+
+
+# First phase of a filtered upload: only the header of page 1 is read
+def read_document_header(stream):
+    try:
+        return parse_header(extract_header_text(stream))
+    except Exception as e:
+        # Unreadable here does not mean unreadable for the full pass
+        log_event("document.header_failed", f"Could not read the header: {str(e)}", logging.WARNING)
+        stream.seek(0)
+        return dict.fromkeys(HEADER_FIELDS, "N/A")
+
+
 # Route for the home page
 @app.route("/")
 def home():
@@ -797,52 +1313,422 @@ def home():
 @app.route("/upload", methods=["GET", "POST"])
 def upload():
     if request.method == "POST":
-        if "files" not in request.files:
-            return render_template("upload.html", message="No file part")
+        with batch("upload") as summary:
+            client = request.remote_addr or "unknown"
+            with admission.admit(client):
+                extracted_data = []
+                job_id = None
+                existing_workbook = None
+                received_files = 0
+                selected_files = 0
+                form = {}
+                doc_filter = None
+                filters_ready = False
+                skipped = Counter()
 
-        files = request.files.getlist("files")
+                # Each PDF is processed as soon as its part is received; nothing is
+                # written to UPLOAD_FOLDER and the spooled copy is dropped right after
+                for kind, name, value in iter_upload_parts():
+                    if kind == "field":
+                        form[name] = value
+                        continue
 
-        if not files or all(file.filename == "" for file in files):
-            return render_template("upload.html", message="No selected files")
+                    if kind == "file" and name == "workbook":
+                        # Optional existing export to merge into (kept until the end)
+                        if value.filename.lower().endswith(".xlsx"):
+                            try:
+                                check_exported_workbook(value.stream)
+                            except InvalidWorkbook:
+                                value.close()
+                                raise
+                            existing_workbook = value
+                        else:
+                            value.close()
+                        continue
 
-        extracted_data = []
+                    if kind != "file" or name != "files":
+                        continue
 
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                pdf_text = extract_text_from_pdf(filepath)
-                parsed_data = parse_marksheet(pdf_text)
-                
-                # Extract subject-wise marks
-                try:
-                    subjects = extract_subject_table(pdf_text)
-                    parsed_data["subjects"] = subjects
-                    logging.info(f"Extracted {len(subjects)} subjects for enrollment {parsed_data.get('Enrollment No', 'Unknown')}")
-                except Exception as e:
-                    logging.warning(f"Failed to extract subjects for enrollment {parsed_data.get('Enrollment No', 'Unknown')}: {str(e)}")
-                    parsed_data["subjects"] = []
-                
-                extracted_data.append(parsed_data)
+                    received_files += 1
+                    file = value
+                    try:
+                        if file.filename == "":
+                            continue
+                        selected_files += 1
+                        if not allowed_file(file.filename):
+                            continue
+
+                        if not filters_ready:
+                            doc_filter = build_document_filter(form, existing_workbook)
+                            filters_ready = True
+
+                        # Filters run on the header; only documents that pass are fully extracted
+                        header = None
+                        if doc_filter is not None:
+                            with admission.slot(client):
+                                header = read_document_header(file.stream)
+                            reason = doc_filter.admit(header)
+                            if reason is not None:
+                                skipped[reason] += 1
+                                log_event("document.skipped", f"Skipped {file.filename}: {reason}", file=file.filename, reason=reason)
+                                continue
+
+                        if task_queue is not None:
+                            # Worker mode: hand the PDF to the shared queue
+                            if job_id is None:
+                                if task_queue.pending_count() >= app.config["MAX_PENDING_DOCUMENTS"]:
+                                    raise Overloaded(503, admission.min_retry_after, "Task queue is full")
+                                job_id = task_queue.create_job()
+                                summary.set(job_id=job_id)
+                            task_queue.enqueue(job_id, file.filename, file.stream)
+                            continue
+
+                        with admission.slot(client):
+                            parsed_data = process_pdf(file.stream, file.filename)
+
+                        if doc_filter is not None:
+                            reason = doc_filter.recheck(header, parsed_data)
+                            if reason is not None:
+                                skipped[reason] += 1
+                                continue
+
+                        extracted_data.append(parsed_data)
+                    finally:
+                        file.close()
+
+                summary.set(skipped=dict(skipped))
+
+            if not received_files:
+                return render_template("upload.html", message="No file part")
+
+            if not selected_files:
+                return render_template("upload.html", message="No selected files")
 
-                # Delete uploaded PDF after processing
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+            if skipped and job_id is None and not extracted_data:
+                return render_template("upload.html", message="No marksheets matched the filters")
 
-        excel_output_file = os.path.join(UPLOAD_FOLDER, "output.xlsx")
-        save_to_excel(extracted_data, excel_output_file)
+            if job_id is not None:
+                if existing_workbook is not None:
+                    task_queue.attach_workbook(job_id, existing_workbook.stream)
+                    existing_workbook.close()
+                task_queue.seal_job(job_id)
+                status = task_queue.wait_for_job(job_id, timeout=app.config["JOB_WAIT_TIMEOUT"])
+                if status["state"] != "done":
+                    # Still running on the workers; the client polls /jobs/<job_id>
+                    return jsonify(job_response(job_id, status)), 202
+                return render_template("download.html", excel_file=assemble_job_output(job_id))
 
-        return render_template("download.html", excel_file="output.xlsx")
+            # Every upload gets its own output so concurrent users never overwrite
+            # each other and a resumed download keeps pointing at the same bytes
+            excel_file = f"output_{uuid.uuid4().hex}.xlsx"
+            excel_output_file = os.path.join(UPLOAD_FOLDER, excel_file)
+            if existing_workbook is not None:
+                try:
+                    df_summary = append_to_excel(existing_workbook.stream, extracted_data, excel_output_file)
+                finally:
+                    existing_workbook.close()
+            else:
+                df_summary = save_to_excel(extracted_data, excel_output_file)
+            artifacts.touch(excel_file)
+            save_batch_index(excel_file, frame_index(df_summary))
+
+            return render_template("download.html", excel_file=excel_file)
 
     return render_template("upload.html")
 
 
-# Download route
+# Progression merge: exported workbooks of earlier batches ("workbooks")
+# and/or marksheet PDFs ("files") -> one row per student across semesters
+@app.route("/progression", methods=["POST"])
+def progression():
+    client = request.remote_addr or "unknown"
+    summary_frames = []
+    subject_frames = []
+    extracted_data = []
+
+    with batch("progression"), admission.admit(client):
+        for kind, name, value in iter_upload_parts():
+            if kind != "file":
+                continue
+
+            file = value
+            try:
+                if name == "workbooks" and file.filename:
+                    # Anything but one of our exports is rejected with a 400 (invalid_workbook)
+                    if not file.filename.lower().endswith(".xlsx"):
+                        raise InvalidWorkbook(f"'{file.filename}' is not an .xlsx workbook")
+                    check_exported_workbook(file.stream)
+                    df_summary, df_subjects = read_exported_workbook(file.stream)
+                    summary_frames.append(df_summary)
+                    subject_frames.append(df_subjects)
+                elif name == "files" and allowed_file(file.filename):
+                    with admission.slot(client):
+                        extracted_data.append(process_pdf(file.stream, file.filename))
+            finally:
+                file.close()
+
+    if extracted_data:
+        summary_frames.append(build_summary_frame(extracted_data))
+        subject_frames.append(build_subject_frame(extracted_data))
+
+    if not summary_frames:
+        return render_template("upload.html", message="No workbooks or marksheets to merge")
+
+    df_progression = build_progression_table(
+        apply_dtypes(pd.concat(summary_frames, ignore_index=True), SUMMARY_DTYPES),
+        apply_dtypes(pd.concat(subject_frames, ignore_index=True), SUBJECT_DTYPES),
+    )
+
+    excel_file = f"progression_{uuid.uuid4().hex}.xlsx"
+    df_progression.to_excel(os.path.join(UPLOAD_FOLDER, excel_file), sheet_name="Progression", index=False)
+    artifacts.touch(excel_file)
+
+    return render_template("download.html", excel_file=excel_file)
+
+
+# Plain dicts (JSON types, None for missing) from a table
+def frame_records(df):
+    return json.loads(df.to_json(orient="records"))
+
+
+def batch_index_path(excel_file):
+    return os.path.join(UPLOAD_FOLDER, excel_file[:-len(".xlsx")] + ".index.json")
+
+
+def frame_index(df_summary):
+    index = StudentIndex()
+    index.add_many(frame_records(df_summary[[column for column in INDEXED_FIELDS if column in df_summary.columns]]))
+    return index
+
+
+def save_batch_index(excel_file, index):
+    """Write the search index of a new export next to it (and keep it loaded)."""
+    fd, partial_file = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".partial-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as index_file:
+            index.dump(index_file)
+        os.replace(partial_file, batch_index_path(excel_file))
+    except BaseException:
+        os.remove(partial_file)
+        raise
+    cache_batch_index(excel_file, index)
+
+
+def read_summary_records(path):
+    """INDEXED_FIELDS of each Student Summary row; the other sheets are never parsed."""
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = workbook["Student Summary"].iter_rows(values_only=True)
+        columns = [(i, column) for i, column in enumerate(next(rows)) if column in INDEXED_FIELDS]
+        for row in rows:
+            record = {column: row[i] if i < len(row) else None for i, column in columns}
+            for column in ("Enrollment No", "Seat No"):
+                if record.get(column) is not None:
+                    record[column] = str(record[column])
+            yield record
+    finally:
+        workbook.close()
+
+
+def cache_batch_index(excel_file, index):
+    with batch_indexes_guard:
+        batch_indexes[excel_file] = index
+        batch_indexes.move_to_end(excel_file)
+        while len(batch_indexes) > app.config["SEARCH_BATCH_CACHE_SIZE"]:
+            batch_indexes.popitem(last=False)
+
+
+def batch_index(excel_file):
+    """
+    Search index of an exported workbook: from the cache, else loaded from
+    the file written with it (rebuilt from the Student Summary sheet if that
+    file was evicted). Threads asking for the same batch load it once.
+    """
+    with batch_indexes_guard:
+        if excel_file in batch_indexes:
+            batch_indexes.move_to_end(excel_file)
+            return batch_indexes[excel_file]
+        lock = batch_index_locks.setdefault(excel_file, threading.Lock())
+
+    try:
+        with lock:
+            with batch_indexes_guard:
+                if excel_file in batch_indexes:
+                    return batch_indexes[excel_file]
+            try:
+                with open(batch_index_path(excel_file), encoding="utf-8") as index_file:
+                    index = StudentIndex.load(index_file)
+            except FileNotFoundError:
+                # Evicted before its workbook: rebuild from the Student Summary sheet
+                index = StudentIndex()
+                index.add_many(read_summary_records(os.path.join(UPLOAD_FOLDER, excel_file)))
+                save_batch_index(excel_file, index)
+            else:
+                cache_batch_index(excel_file, index)
+            return index
+    finally:
+        with batch_indexes_guard:
+            batch_index_locks.pop(excel_file, None)
+
+
+# Find students by (partial, misspelled, reordered) name, Enrollment No or Seat No prefix
+@app.route("/search")
+def search():
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 20, type=int)
+    excel_file = request.args.get("batch")
+
+    if not excel_file:
+        return jsonify({"error": "Missing 'batch' (the exported workbook to search)"}), 400
+    if not excel_file.startswith("output") or not JOB_ARTIFACT_PATTERN.match(excel_file) or not artifacts.touch(excel_file):
+        return jsonify({"error": f"Unknown batch '{excel_file}'"}), 404
+
+    # Keep the index file as recently used as its workbook, so quota eviction takes them together
+    artifacts.touch(os.path.basename(batch_index_path(excel_file)))
+
+    started = time.perf_counter()
+    index = batch_index(excel_file)
+
+    results = index.search(query, limit=limit)
+    return jsonify({
+        "query": query,
+        "batch": excel_file,
+        "indexed": len(index),
+        "results": results,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+# Reject oversized uploads with a readable message instead of a bare 413
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return render_template("upload.html", message=e.description), 413
+
+
+# Uploaded workbooks that are not our exports are a client error, not a 500
+@app.errorhandler(InvalidWorkbook)
+def invalid_workbook(e):
+    return render_template("upload.html", message=str(e)), 400
+
+
+# Shed load with Retry-After instead of queueing work we cannot finish
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+# Differences between the current and the candidate parsers (shadow mode)
+@app.route("/shadow/report")
+def shadow_report():
+    if not shadow.candidates:
+        return jsonify({"error": "Shadow mode is not enabled (set SHADOW_CANDIDATES)"}), 404
+    return jsonify(shadow.report())
+
+
+# Queue statistics for capacity planning
+@app.route("/stats/queue")
+def queue_stats():
+    return jsonify(admission.stats())
+
+
+# Per-job locks for assemble_job_output (guarded by job_output_locks_guard)
+job_output_locks = {}
+job_output_locks_guard = threading.Lock()
+
+
+def assemble_job_output(job_id):
+    """
+    Build the Excel output of a finished worker-mode job unless it exists.
+
+    Threads of one process build it once (the others wait on a per-job lock).
+    Separate processes may each build it, into their own temporary file; the
+    renames are atomic and both copies hold the same rows, so readers only
+    ever see a complete workbook.
+    """
+    excel_file = f"output_{job_id}.xlsx"
+    excel_output_file = os.path.join(UPLOAD_FOLDER, excel_file)
+
+    with job_output_locks_guard:
+        lock = job_output_locks.setdefault(job_id, threading.Lock())
+    try:
+        with lock:
+            if not os.path.exists(excel_output_file):
+                build_job_output(job_id, excel_output_file)
+                artifacts.touch(excel_file)
+    finally:
+        with job_output_locks_guard:
+            job_output_locks.pop(job_id, None)
+    return excel_file
+
+
+def build_job_output(job_id, excel_output_file):
+    # Write aside and rename so concurrent status polls never see a partial file
+    # (.xlsx suffix: pandas picks the Excel engine from the extension)
+    fd, partial_file = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".partial-", suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook_path = task_queue.workbook_path(job_id)
+        if os.path.exists(workbook_path):
+            results = task_queue.job_results(job_id)
+            index = frame_index(append_to_excel(workbook_path, results, partial_file))
+        else:
+            # Results are streamed from the queue so job size does not bound memory
+            assembler = BatchAssembler(run_size=app.config["EXPORT_RUN_SIZE"], spill_dir=app.config["SPOOL_DIR"])
+            index = StudentIndex()
+            try:
+                for student_data in task_queue.iter_job_results(job_id):
+                    assembler.add(student_data)
+                assembler.write_excel(partial_file, index=index)
+            finally:
+                assembler.close()
+        os.replace(partial_file, excel_output_file)
+    except BaseException:
+        os.remove(partial_file)
+        raise
+    save_batch_index(os.path.basename(excel_output_file), index)
+
+
+def job_response(job_id, status):
+    response = {"job_id": job_id, "status_url": f"/jobs/{job_id}", **status}
+    if status["state"] == "done":
+        response["download_url"] = f"/download/{assemble_job_output(job_id)}"
+    return response
+
+
+# Status of a worker-mode job; assembles the output when all documents are done
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    if task_queue is None:
+        return jsonify({"error": "Worker mode is not enabled"}), 404
+
+    status = task_queue.job_status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+
+    return jsonify(job_response(job_id, status))
+
+
+# Download route: conditional GET (ETag / Last-Modified) and byte ranges, so
+# repeated or interrupted downloads do not transfer the whole workbook again
 @app.route("/download/<filename>")
 def download_file(filename):
+    if not JOB_ARTIFACT_PATTERN.match(filename) or not artifacts.touch(filename):
+        abort(404)
+
+    if app.config["DOWNLOAD_OFFLOAD"] == "x-accel-redirect":
+        response = app.response_class(mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        response.headers["X-Accel-Redirect"] = app.config["DOWNLOAD_ACCEL_PREFIX"] + filename
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
     return send_file(
-        os.path.join(app.config["UPLOAD_FOLDER"], filename), as_attachment=True
+        os.path.join(app.config["UPLOAD_FOLDER"], filename),
+        as_attachment=True,
+        conditional=True,
+        etag=True,
     )
 
 
@@ -854,18 +1740,8 @@ def test():
     if not os.path.exists(file_path):
         return jsonify({"error": f"File '{file_path}' not found"}), 404
 
-    pdf_text = extract_text_from_pdf(file_path)
-    parsed_data = parse_marksheet(pdf_text)
-    
-    # Extract subject-wise marks
-    try:
-        subjects = extract_subject_table(pdf_text)
-        parsed_data["subjects"] = subjects
-        logging.info(f"Extracted {len(subjects)} subjects for enrollment {parsed_data.get('Enrollment No', 'Unknown')}")
-    except Exception as e:
-        logging.warning(f"Failed to extract subjects for enrollment {parsed_data.get('Enrollment No', 'Unknown')}: {str(e)}")
-        parsed_data["subjects"] = []
-    
+    parsed_data = process_pdf(file_path)
+
     excel_output_file = os.path.join(UPLOAD_FOLDER, "output.xlsx")
     save_to_excel([parsed_data], excel_output_file)
 
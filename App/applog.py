@@ -0,0 +1,229 @@
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Correlation ids stamped on every record logged inside a batch / document
+batch_id = contextvars.ContextVar("batch_id", default=None)
+document_id = contextvars.ContextVar("document_id", default=None)
+current_batch = contextvars.ContextVar("current_batch", default=None)
+
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+
+def parse_sample_rates(spec):
+    """
+    Parse "event=rate,event=rate" into {event: rate}.
+    e.g. LOG_SAMPLE_RATES="document.processed=0.1"
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            raise ValueError(f"Invalid log sample rate '{item}' (expected event=rate)")
+    return rates
+
+
+@contextmanager
+def correlation(batch=None, document=None):
+    """Set the batch and/or document id for everything logged inside the block."""
+    tokens = []
+    if batch is not None:
+        tokens.append((batch_id, batch_id.set(batch)))
+    if document is not None:
+        tokens.append((document_id, document_id.set(document)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def log_event(event, message, level=logging.INFO, logger=None, **fields):
+    """Log a named event; `fields` become top-level keys of the JSON record."""
+    logger = logger or logging.getLogger()
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event, "fields": fields})
+
+
+class BatchSummary:
+    """Totals for one batch, logged as a single "batch.summary" record."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.subjects = 0
+        self.failed = 0
+        self.stage_seconds = Counter()
+        self.fields = {}
+
+    def add_document(self, timings, subjects, failed=False):
+        self.documents += 1
+        self.subjects += subjects
+        self.failed += failed
+        self.stage_seconds.update(timings)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def as_fields(self):
+        return {
+            "kind": self.kind,
+            "documents": self.documents,
+            "subjects": self.subjects,
+            "failed": self.failed,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "stage_seconds": {stage: round(seconds, 4) for stage, seconds in self.stage_seconds.items()},
+            **self.fields,
+        }
+
+
+@contextmanager
+def batch(kind, batch=None):
+    """
+    Run a batch (one upload, one worker run) under its own correlation id and
+    log one summary record for it at the end instead of a line per document.
+    """
+    summary = BatchSummary(kind)
+    token = current_batch.set(summary)
+    try:
+        with correlation(batch=batch or new_id()):
+            try:
+                yield summary
+            except Exception as e:
+                summary.set(error=str(e))
+                raise
+            finally:
+                log_event("batch.summary", f"{kind} batch finished", **summary.as_fields())
+    finally:
+        current_batch.reset(token)
+
+
+def record_document(timings, subjects, failed=False):
+    """Count a processed document towards the current batch summary, if any."""
+    summary = current_batch.get()
+    if summary is not None:
+        summary.add_document(timings, subjects, failed)
+
+
+class EventFilter(logging.Filter):
+    """
+    Drops a share of each sampled event (rates from parse_sample_rates; other
+    records always pass) and stamps the correlation ids. Runs in the calling
+    thread, before the record is queued, so dropped records cost nothing more.
+    """
+
+    def __init__(self, sample_rates=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        rate = self.sample_rates.get(getattr(record, "event", None), 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                return False
+            record.sample_rate = rate
+        record.batch_id = batch_id.get()
+        record.document_id = document_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "event": getattr(record, "event", None),
+            "message": record.getMessage(),
+            "batch_id": getattr(record, "batch_id", None),
+            "document_id": getattr(record, "document_id", None),
+        }
+        if hasattr(record, "sample_rate"):
+            entry["sample_rate"] = record.sample_rate
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Queues records for a listener thread that formats and writes them, so
+    request threads never block on the output stream. The listener is
+    started lazily in each process (again after a fork: gunicorn workers do
+    not inherit the master's thread).
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._listener_pid = None
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (arguments may change later),
+        # leave the JSON formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        # Called with the handler lock held, which logging re-creates after a fork
+        if self._listener_pid != os.getpid():
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+        super().emit(record)
+
+    def close(self):
+        # Flush what is queued (logging.shutdown calls this at exit)
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+        self.target.flush()
+        super().close()
+
+
+def configure_logging(level="INFO", sample_rates=None, stream=None):
+    """Route the root logger through an AsyncHandler writing JSON lines."""
+    target = logging.StreamHandler(stream or sys.stderr)
+    target.setFormatter(JsonFormatter())
+
+    handler = AsyncHandler(target)
+    handler.addFilter(EventFilter(sample_rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    logging.getLogger("pdfminer").setLevel(logging.ERROR)
+    return handler
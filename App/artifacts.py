@@ -0,0 +1,131 @@
+import fnmatch
+import gzip
+import logging
+import os
+import threading
+import time
+
+
+class ArtifactManager:
+    """
+    Retention for files generated into the uploads folder.
+
+    - Every artifact gets a TTL from the first matching pattern in `ttls`
+      (falling back to `default_ttl`), counted from its last write.
+    - Total size is kept under `quota_bytes` by evicting the least recently
+      used artifacts first. Files used within `grace_seconds` are never
+      evicted for quota, so an output is not removed before it is downloaded.
+    - A daemon thread sweeps every `sweep_interval` seconds, then runs
+      `on_sweep` (if given) for related cleanup such as the task queue.
+
+    All state comes from the directory itself (mtime = written, atime =
+    last use, set explicitly by touch()), so several processes sharing the
+    folder agree on it without coordination.
+    """
+
+    def __init__(self, root, quota_bytes, default_ttl, ttls=None, sweep_interval=300,
+                 grace_seconds=300, compress_text=False, on_sweep=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.sweep_interval = sweep_interval
+        self.grace_seconds = grace_seconds
+        self.compress_text = compress_text
+        self.on_sweep = on_sweep
+
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def ttl_for(self, name):
+        for pattern, ttl in self.ttls.items():
+            if fnmatch.fnmatch(name, pattern):
+                return ttl
+        return self.default_ttl
+
+    def touch(self, name):
+        """Record a use of an artifact (for LRU eviction); False if it is gone."""
+        path = self.path(name)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def write_text(self, name, text):
+        """Write an intermediate text artifact, gzip-compressed if enabled."""
+        if self.compress_text:
+            name += ".gz"
+            with gzip.open(self.path(name), "wt", encoding="utf-8", compresslevel=1) as output_file:
+                output_file.write(text)
+        else:
+            with open(self.path(name), "w", encoding="utf-8") as output_file:
+                output_file.write(text)
+        return name
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append((entry.name, st.st_size, st.st_mtime, max(st.st_atime, st.st_mtime)))
+        return entries
+
+    def _remove(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Remove expired artifacts, then evict LRU artifacts over the quota."""
+        with self._lock:
+            now = time.time()
+            removed = []
+            kept = []
+
+            for name, size, mtime, last_used in self._scan():
+                if now - mtime > self.ttl_for(name):
+                    self._remove(name)
+                    removed.append(name)
+                else:
+                    kept.append((last_used, name, size))
+
+            total = sum(size for _, _, size in kept)
+            if self.quota_bytes is not None and total > self.quota_bytes:
+                for last_used, name, size in sorted(kept):
+                    if total <= self.quota_bytes:
+                        break
+                    if now - last_used < self.grace_seconds:
+                        continue
+                    self._remove(name)
+                    removed.append(name)
+                    total -= size
+
+            if removed:
+                logging.info(f"Artifact sweep removed {len(removed)} file(s); {total} bytes in use")
+            return removed
+
+    def ensure_sweeper(self):
+        """Start the background sweeper in this process (again after a fork)."""
+        if not self.sweep_interval or self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_loop, name="artifact-sweeper", daemon=True).start()
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep()
+                if self.on_sweep is not None:
+                    self.on_sweep()
+            except Exception as e:
+                logging.error(f"Artifact sweep failed: {str(e)}")
+            time.sleep(self.sweep_interval)
@@ -0,0 +1,66 @@
+"""
+gunicorn settings for running the analyzer in production:
+
+    cd App && gunicorn -c gunicorn.conf.py wsgi:app
+
+- preload_app: pdfminer, pandas and openpyxl are imported once in the master
+  and shared copy-on-write by the forked workers.
+- Each worker parses a sample marksheet before it accepts traffic.
+- A worker is recycled after MAX_DOCUMENTS_PER_WORKER documents (plus a
+  random jitter so workers do not restart together) to cap pdfminer's
+  memory growth.
+- MAX_ACTIVE_DOCUMENTS and MAX_PENDING_DOCUMENTS stay limits for the whole
+  server: each worker's admission controller gets 1/WEB_CONCURRENCY of them,
+  and enough threads that every upload reaches its controller, so excess
+  load is shed with 503/Retry-After instead of waiting in gunicorn's backlog.
+  MAX_CLIENT_REQUESTS applies per worker.
+"""
+import gc
+import multiprocessing
+import os
+import random
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Read by app.py (preloaded after this file): split the admission limits across workers
+os.environ["ADMISSION_PROCESSES"] = str(workers)
+active_per_worker = -(-int(os.environ.get("MAX_ACTIVE_DOCUMENTS", multiprocessing.cpu_count())) // workers)
+pending_per_worker = -(-int(os.environ.get("MAX_PENDING_DOCUMENTS", 64)) // workers)
+
+# Threads let a worker keep receiving streamed uploads while another one parses.
+# Beyond active + pending uploads a thread is left over to answer 503 (and
+# one more for status polls and downloads)
+worker_class = "gthread"
+threads = int(os.environ.get("WORKER_THREADS", active_per_worker + pending_per_worker + 2))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+graceful_timeout = 30
+preload_app = True
+
+max_documents_per_worker = int(os.environ.get("MAX_DOCUMENTS_PER_WORKER", 500))
+max_documents_jitter = int(os.environ.get("MAX_DOCUMENTS_JITTER", 50))
+
+
+def when_ready(server):
+    # Everything allocated so far is shared with the workers; keep the garbage
+    # collector from touching (and so copying) those pages in every child
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.max_documents = max_documents_per_worker + random.randint(0, max_documents_jitter)
+
+
+def post_worker_init(worker):
+    import wsgi
+
+    wsgi.warm_up()
+    worker.log.info(f"Worker {worker.pid} warmed up, recycling after {worker.max_documents} documents")
+
+
+def post_request(worker, req, environ, resp):
+    import app as marksheet_app
+
+    if worker.alive and marksheet_app.processed_documents >= worker.max_documents:
+        worker.log.info(f"Worker {worker.pid} processed {marksheet_app.processed_documents} documents, recycling")
+        worker.alive = False
@@ -0,0 +1,354 @@
+"""
+Load generator for the HTTP endpoints.
+
+Starts the app locally (gunicorn with gunicorn.conf.py, or Flask's threaded
+server), sends multi-file uploads built from the sample marksheets, downloads
+each resulting workbook, and reports throughput, latency percentiles, errors
+and the peak RSS of the server processes:
+
+    python loadtest.py --concurrency 50 --requests 500
+    python loadtest.py --rate 5 --duration 60 --env WEB_CONCURRENCY=4 --json run.json
+    python loadtest.py --url http://staging:5000 --concurrency 20
+
+With --rate uploads arrive on a Poisson schedule (open loop) and latency is
+counted from the scheduled arrival, so time spent waiting for a free client
+is included; without it every client sends its next upload right away.
+
+All clients share one address, so admission control would answer 429 beyond
+MAX_CLIENT_REQUESTS concurrent uploads. A server started here gets
+MAX_CLIENT_REQUESTS=--concurrency unless --env sets it (to measure that limit).
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SAMPLE_PDFS = os.path.join(BASE_DIR, os.pardir, "Uploads", "copy_*.pdf")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def multipart_body(files):
+    """(content type, body) of a form upload with `files` as the "files" parts."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, data in files:
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            "Content-Type: application/pdf\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return f"multipart/form-data; boundary={boundary}", b"".join(parts)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of pid and all its descendants; None off Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat_file:
+                    # The command name may contain spaces; ppid follows the closing ")"
+                    ppid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children[ppid].append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, ()))
+        try:
+            with open(f"/proc/{current}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+
+class Server:
+    """The app under test, started in its own process group."""
+
+    def __init__(self, kind, port, env):
+        self.kind = kind
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.env = dict(os.environ, **env)
+        self.process = None
+
+    def start(self, timeout=60):
+        if self.kind == "gunicorn":
+            self.env["BIND"] = f"127.0.0.1:{self.port}"
+            command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+        else:
+            command = [
+                sys.executable, "-c",
+                f"from app import app; app.run(host='127.0.0.1', port={self.port}, threaded=True)",
+            ]
+        self.process = subprocess.Popen(
+            command, cwd=BASE_DIR, env=self.env, start_new_session=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.kind} exited with status {self.process.returncode}")
+            try:
+                status, _ = request(self.url, "GET", "/")
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"{self.kind} did not answer within {timeout}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+
+
+def request(base_url, method, path, body=None, headers=None, timeout=300):
+    """(status, body) of one request on a fresh connection."""
+    url = urllib.parse.urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(url.hostname, url.port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+class LoadTest:
+    def __init__(self, base_url, samples, files_per_upload, download=True):
+        self.base_url = base_url
+        self.samples = samples
+        self.files_per_upload = files_per_upload
+        self.download = download
+
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.statuses = defaultdict(Counter)  # endpoint -> status (or exception name)
+        self.documents = 0
+
+    def _record(self, endpoint, status, seconds):
+        with self._lock:
+            self.statuses[endpoint][status] += 1
+            if isinstance(status, int) and status < 400:
+                self.latencies[endpoint].append(seconds)
+
+    def one_upload(self, scheduled=None):
+        """Upload files_per_upload random samples, then download the workbook."""
+        files = [random.choice(self.samples) for _ in range(self.files_per_upload)]
+        content_type, body = multipart_body(files)
+        started = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            status, response = request(self.base_url, "POST", "/upload", body, {"Content-Type": content_type})
+        except Exception as e:
+            self._record("upload", type(e).__name__, time.perf_counter() - started)
+            return
+        self._record("upload", status, time.perf_counter() - started)
+        if status >= 400:
+            return
+        with self._lock:
+            self.documents += len(files)
+
+        # HTML download page, or JSON with download_url in worker mode
+        text = response.decode("utf-8", "replace")
+        marker = text.find("/download/")
+        if not self.download or marker < 0:
+            return
+        path = text[marker:].split('"', 1)[0].split("'", 1)[0]
+        started = time.perf_counter()
+        try:
+            status, _ = request(self.base_url, "GET", path)
+        except Exception as e:
+            status = type(e).__name__
+        self._record("download", status, time.perf_counter() - started)
+
+    def run(self, concurrency, requests=None, duration=None, rate=None):
+        deadline = time.perf_counter() + duration if duration else None
+        started = time.perf_counter()
+
+        def more(sent):
+            return (requests is None or sent < requests) and (deadline is None or time.perf_counter() < deadline)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if rate:
+                # Open loop: arrivals do not wait for earlier responses
+                sent = 0
+                next_arrival = time.perf_counter()
+                while more(sent):
+                    next_arrival += random.expovariate(rate)
+                    time.sleep(max(next_arrival - time.perf_counter(), 0))
+                    pool.submit(self.one_upload, next_arrival)
+                    sent += 1
+            else:
+                # Closed loop: each client sends its next upload when the last one returns
+                counter = iter(range(sys.maxsize))
+                counter_lock = threading.Lock()
+
+                def client():
+                    while True:
+                        with counter_lock:
+                            if not more(next(counter)):
+                                return
+                        self.one_upload()
+
+                for _ in range(concurrency):
+                    pool.submit(client)
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(self.statuses):
+            latencies = sorted(self.latencies[endpoint])
+            total = sum(self.statuses[endpoint].values())
+            errors = total - len(latencies)
+            endpoints[endpoint] = {
+                "requests": total,
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "statuses": {str(status): count for status, count in self.statuses[endpoint].items()},
+                "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+                "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+            }
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "documents": self.documents,
+            "documents_per_second": round(self.documents / elapsed, 3) if elapsed else None,
+            "endpoints": endpoints,
+        }
+
+
+def sample_peak_rss(pid, stop, peak, interval=0.2):
+    while not stop.is_set():
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            peak["bytes"] = max(peak.get("bytes", 0), rss)
+        stop.wait(interval)
+
+
+def print_report(report):
+    print(f"{report['documents']} documents in {report['elapsed_seconds']}s "
+          f"({report['documents_per_second']} documents/s)")
+    for endpoint, stats in report["endpoints"].items():
+        print(
+            f"{endpoint:>9}: {stats['requests']} requests, {stats['errors']} errors "
+            f"({stats['error_rate']:.1%}), {stats['throughput_rps']} req/s, "
+            f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms"
+        )
+        if stats["errors"]:
+            print(f"{'':>11}statuses: {stats['statuses']}")
+    if report.get("peak_rss_bytes"):
+        print(f"peak RSS: {report['peak_rss_bytes'] / (1024 * 1024):.1f} MiB (server process tree)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /upload and /download")
+    parser.add_argument("--server", choices=["gunicorn", "flask"], default="gunicorn",
+                        help="server to start locally (ignored with --url)")
+    parser.add_argument("--url", help="test an already running server instead")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="environment for the started server, e.g. WEB_CONCURRENCY=4")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent clients")
+    parser.add_argument("--rate", type=float, default=None, help="uploads per second (open loop)")
+    parser.add_argument("--requests", type=int, default=None, help="total uploads (default 100 without --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to send uploads for")
+    parser.add_argument("--files-per-upload", type=int, default=3)
+    parser.add_argument("--no-download", action="store_true", help="do not download the workbooks")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("pdfs", nargs="*", default=sorted(glob.glob(SAMPLE_PDFS)))
+    args = parser.parse_args()
+
+    if not args.pdfs:
+        parser.error("no sample PDFs found")
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+
+    samples = []
+    for pdf in args.pdfs:
+        with open(pdf, "rb") as pdf_file:
+            samples.append((os.path.basename(pdf), pdf_file.read()))
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        env = dict(item.split("=", 1) for item in args.env)
+        # Every client shares 127.0.0.1: let each of them have an upload in flight
+        env.setdefault("MAX_CLIENT_REQUESTS", str(args.concurrency))
+        server = Server(args.server, free_port(), env)
+        server.start()
+        base_url = server.url
+
+    stop = threading.Event()
+    peak = {}
+    if server is not None:
+        threading.Thread(target=sample_peak_rss, args=(server.process.pid, stop, peak), daemon=True).start()
+
+    try:
+        load = LoadTest(base_url, samples, args.files_per_upload, download=not args.no_download)
+        elapsed = load.run(args.concurrency, requests=args.requests, duration=args.duration, rate=args.rate)
+    finally:
+        stop.set()
+        if server is not None:
+            server.stop()
+
+    report = load.report(elapsed)
+    report["config"] = {
+        "server": "external" if args.url else args.server,
+        "env": args.env,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "files_per_upload": args.files_per_upload,
+    }
+    report["peak_rss_bytes"] = peak.get("bytes")
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=2)
@@ -0,0 +1,157 @@
+import os
+import re
+
+from pdfminer.pdfdevice import PDFTextDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+
+# Header fields read in the first phase (the rest needs the full layout pass)
+HEADER_FIELDS = ["Student Name", "Enrollment No", "Examination", "Seat No", "Semester"]
+
+# The header is drawn first on page 1 and ends with "<ORDINAL> SEMESTER"
+HEADER_END = re.compile(r"(FIRST|SECOND|THIRD|FOURTH|FIFTH|SIXTH)\s+SEMESTER")
+
+# Text comes out in content stream order without line breaks, e.g.
+# "MR. / MS.KALE KRUSHNA NAVNATH   ENROLLMENT NO.2210920115EXAMINATIONWINTER 2024..."
+HEADER_PATTERNS = {
+    "Student Name": re.compile(r"MR\. / MS\.\s*([A-Z][A-Z ]*?)\s*ENROLLMENT NO\."),
+    "Enrollment No": re.compile(r"ENROLLMENT NO\.\s*(\d+)"),
+    "Examination": re.compile(r"EXAMINATION\s*([A-Z]+\s+\d+)"),
+    "Seat No": re.compile(r"SEAT NO\.\s*(\d+)"),
+    "Semester": HEADER_END,
+}
+
+
+class _HeaderComplete(Exception):
+    pass
+
+
+class HeaderTextDevice(PDFTextDevice):
+    """
+    Collects the characters of a page in drawing order and stops the
+    interpreter as soon as the header is complete. No layout objects are
+    built, and nothing after the header is parsed.
+    """
+
+    def __init__(self, rsrcmgr):
+        super().__init__(rsrcmgr)
+        self.chars = []
+
+    def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate):
+        try:
+            text = font.to_unichr(cid)
+        except PDFUnicodeNotDefined:
+            text = ""
+        self.chars.append(text)
+        if text == "R" and HEADER_END.search("".join(self.chars[-16:])):
+            raise _HeaderComplete()
+        return font.char_width(cid) * fontsize * scaling
+
+    @property
+    def text(self):
+        return "".join(self.chars)
+
+
+def extract_header_text(source):
+    """Header text of a marksheet (path or binary file object), page 1 only."""
+    rsrcmgr = PDFResourceManager()
+    device = HeaderTextDevice(rsrcmgr)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+
+    pdf_file = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        for page in PDFPage.get_pages(pdf_file, maxpages=1):
+            try:
+                interpreter.process_page(page)
+            except _HeaderComplete:
+                pass
+    finally:
+        if pdf_file is not source:
+            pdf_file.close()
+        else:
+            source.seek(0)
+    return device.text
+
+
+def parse_header(text):
+    """HEADER_FIELDS found in extract_header_text output ("N/A" when missing)."""
+    header = {}
+    for field, pattern in HEADER_PATTERNS.items():
+        match = pattern.search(text)
+        header[field] = match.group(1).strip() if match else "N/A"
+    return header
+
+
+def student_key(record):
+    """(Enrollment No, Semester, Examination), or None if any part is unknown."""
+    key = tuple(str(record.get(field, "N/A")) for field in ("Enrollment No", "Semester", "Examination"))
+    return None if any(part in ("N/A", "", "None", "nan") for part in key) else key
+
+
+class DocumentFilter:
+    """
+    Upload filters applied to the header of each marksheet before its full
+    extraction: semesters, a Seat No range and (with skip_duplicates) students
+    already seen in this upload or in `exported_keys`.
+
+    A field the header phase could not read never rejects a document; the
+    same checks then run again on the fully parsed result.
+    """
+
+    def __init__(self, semesters=None, seat_from=None, seat_to=None, skip_duplicates=False, exported_keys=None):
+        self.semesters = {semester.upper() for semester in semesters or ()}
+        self.seat_from = seat_from
+        self.seat_to = seat_to
+        self.skip_duplicates = skip_duplicates
+        self.seen_keys = set(exported_keys or ())
+
+    @classmethod
+    def from_form(cls, form):
+        """
+        Build from upload form fields, or None when no filter is requested:
+        semesters ("FIFTH,SIXTH"), seat_from, seat_to, skip_duplicates ("1").
+        """
+        semesters = [part.strip() for part in form.get("semesters", "").split(",") if part.strip()]
+        seat_from = int(form["seat_from"]) if form.get("seat_from", "").strip().isdigit() else None
+        seat_to = int(form["seat_to"]) if form.get("seat_to", "").strip().isdigit() else None
+        skip_duplicates = form.get("skip_duplicates") in ("1", "on", "true")
+        if not (semesters or seat_from is not None or seat_to is not None or skip_duplicates):
+            return None
+        return cls(semesters, seat_from, seat_to, skip_duplicates)
+
+    def rejection(self, record, duplicates=True):
+        """Why `record` (header or parsed marksheet) is filtered out, or None."""
+        semester = str(record.get("Semester", "N/A"))
+        if self.semesters and semester != "N/A" and semester not in self.semesters:
+            return "semester"
+
+        seat = str(record.get("Seat No", "N/A"))
+        if seat.isdigit():
+            if self.seat_from is not None and int(seat) < self.seat_from:
+                return "seat_range"
+            if self.seat_to is not None and int(seat) > self.seat_to:
+                return "seat_range"
+
+        if duplicates and self.skip_duplicates:
+            key = student_key(record)
+            if key is not None and key in self.seen_keys:
+                return "duplicate"
+        return None
+
+    def admit(self, record):
+        """rejection() that also remembers an admitted student for duplicate checks."""
+        reason = self.rejection(record)
+        if reason is None and self.skip_duplicates:
+            key = student_key(record)
+            if key is not None:
+                self.seen_keys.add(key)
+        return reason
+
+    def recheck(self, header, parsed):
+        """After full extraction: the same checks on the parsed marksheet."""
+        if student_key(header) is None:
+            return self.admit(parsed)
+        # The duplicate check was already decided (and recorded) on the header
+        return self.rejection(parsed, duplicates=False)
@@ -0,0 +1,179 @@
+import bisect
+import json
+import re
+import threading
+from collections import Counter
+
+
+# Fields kept per student in the index (and returned by /search)
+INDEXED_FIELDS = [
+    "Student Name", "Enrollment No", "Seat No", "Examination",
+    "Semester", "Percentage", "Result",
+]
+
+
+def name_tokens(name):
+    return re.findall(r"[A-Z0-9]+", str(name).upper())
+
+
+def token_grams(token, n=3):
+    """Character n-grams of one token, padded so short tokens still match."""
+    padded = f"${token}$"
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def name_grams(name):
+    # Grams are taken per token, so word order does not matter:
+    # "KAWDE POOJA" and "POOJA KAWDE" produce the same set
+    grams = set()
+    for token in name_tokens(name):
+        grams |= token_grams(token)
+    return grams
+
+
+class StudentIndex:
+    """
+    In-memory lookup over parsed marksheets.
+
+    - Student Name: trigram inverted index, ranked by the share of query
+      trigrams found blended with Dice similarity, plus a bonus for whole-word
+      matches; tolerant to typos, partial names and word order. Postings
+      point at distinct names (same tokens, any order), so students sharing
+      a name are scored once.
+    - Enrollment No / Seat No: sorted arrays searched by prefix with bisect.
+
+    Students are keyed by (Enrollment No, Semester, Examination); adding the
+    same key again replaces the earlier row.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = []  # doc id -> record (None once replaced)
+        self._keys = {}  # student key -> doc id
+        self._name_ids = {}  # frozenset of name tokens -> name id
+        self._names = []  # name id -> [number of grams, sorted tokens, doc ids]
+        self._postings = {}  # gram -> list of name ids
+        self._prefix = {"Enrollment No": [], "Seat No": []}  # sorted (value, doc id)
+        self._prefix_dirty = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def dump(self, index_file):
+        """Write the built index as JSON, so load() does not have to re-tokenize."""
+        with self._lock:
+            self._prefix_matches("Enrollment No", "")  # sort the prefix arrays first
+            json.dump({
+                "docs": self._docs,
+                "names": self._names,
+                "postings": self._postings,
+                "prefix": self._prefix,
+            }, index_file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, index_file):
+        """An index written by dump()."""
+        state = json.load(index_file)
+        index = cls()
+        index._docs = state["docs"]
+        index._names = state["names"]
+        index._postings = state["postings"]
+        index._prefix = {field: [tuple(entry) for entry in entries] for field, entries in state["prefix"].items()}
+        for name_id, (_, tokens, _) in enumerate(index._names):
+            index._name_ids[frozenset(tokens)] = name_id
+        for doc_id, doc in enumerate(index._docs):
+            if doc is not None:
+                index._keys[(doc["Enrollment No"], doc["Semester"], doc["Examination"])] = doc_id
+        return index
+
+    def add_many(self, records):
+        with self._lock:
+            for record in records:
+                self._add(record)
+
+    def _add(self, record):
+        doc = {field: record.get(field) for field in INDEXED_FIELDS}
+        key = (doc["Enrollment No"], doc["Semester"], doc["Examination"])
+
+        # Replace an earlier copy: it leaves its name's doc set, so only its
+        # (stale) prefix entries remain, skipped once the doc is None
+        if key in self._keys:
+            old_id = self._keys[key]
+            old_tokens = frozenset(name_tokens(self._docs[old_id]["Student Name"]))
+            self._names[self._name_ids[old_tokens]][2].remove(old_id)
+            self._docs[old_id] = None
+
+        doc_id = len(self._docs)
+        self._docs.append(doc)
+        self._keys[key] = doc_id
+
+        tokens = frozenset(name_tokens(doc["Student Name"]))
+        name_id = self._name_ids.get(tokens)
+        if name_id is None:
+            name_id = len(self._names)
+            grams = name_grams(doc["Student Name"])
+            self._name_ids[tokens] = name_id
+            self._names.append([len(grams), sorted(tokens), []])
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(name_id)
+        self._names[name_id][2].append(doc_id)
+
+        for field, entries in self._prefix.items():
+            value = doc[field]
+            if value is not None and str(value) not in ("", "N/A", "nan"):
+                entries.append((str(value), doc_id))
+        self._prefix_dirty = True
+
+    def _prefix_matches(self, field, prefix):
+        entries = self._prefix[field]
+        if self._prefix_dirty:
+            for values in self._prefix.values():
+                values.sort()
+            self._prefix_dirty = False
+        start = bisect.bisect_left(entries, (prefix,))
+        for value, doc_id in entries[start:]:
+            if not value.startswith(prefix):
+                break
+            yield doc_id
+
+    def search(self, query, limit=20, min_score=0.4):
+        """Ranked matches for a name, an Enrollment No prefix or a Seat No prefix."""
+        query = str(query).strip().upper()
+        if not query:
+            return []
+
+        with self._lock:
+            scored = {}
+            if query.isdigit():
+                for field in ("Enrollment No", "Seat No"):
+                    for doc_id in self._prefix_matches(field, query):
+                        if self._docs[doc_id] is not None:
+                            value = str(self._docs[doc_id][field])
+                            # Exact match first, then shorter remainders
+                            score = len(query) / len(value)
+                            scored[doc_id] = max(scored.get(doc_id, 0), score)
+            else:
+                query_grams = name_grams(query)
+                query_tokens = set(name_tokens(query))
+                hits = Counter()
+                for gram in query_grams:
+                    hits.update(self._postings.get(gram, ()))
+
+                for name_id, common in hits.items():
+                    gram_count, tokens, doc_ids = self._names[name_id]
+                    if not doc_ids:
+                        continue
+                    # Mostly how much of the query is found (partial names match),
+                    # partly overall similarity (closer full names rank higher)
+                    coverage = common / len(query_grams)
+                    dice = 2 * common / (len(query_grams) + gram_count)
+                    score = 0.7 * coverage + 0.3 * dice
+                    score += 0.1 * len(query_tokens.intersection(tokens))
+                    if score >= min_score:
+                        for doc_id in doc_ids:
+                            scored[doc_id] = score
+
+            ranked = sorted(scored.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [dict(self._docs[doc_id], score=round(score, 3)) for doc_id, score in ranked]
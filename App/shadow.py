@@ -0,0 +1,205 @@
+import importlib
+import io
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+
+
+# Pipeline stages a candidate can replace, in pipeline order
+STAGES = ["extract_text", "parse_marksheet", "extract_subject_table"]
+
+
+def load_candidates(spec):
+    """
+    Parse "stage=module:function,stage=module:function" into {stage: callable}.
+    e.g. SHADOW_CANDIDATES="parse_marksheet=fastparse:parse_marksheet"
+    """
+    candidates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        stage, _, target = item.partition("=")
+        module_name, _, function_name = target.partition(":")
+        if stage not in STAGES or not module_name or not function_name:
+            raise ValueError(f"Invalid shadow candidate '{item}' (expected stage=module:function)")
+        candidates[stage] = getattr(importlib.import_module(module_name), function_name)
+    return candidates
+
+
+def diff_values(baseline, candidate, path=""):
+    """Field-level differences as (path, baseline, candidate) tuples."""
+    if isinstance(baseline, dict) and isinstance(candidate, dict):
+        differences = []
+        for key in list(baseline) + [key for key in candidate if key not in baseline]:
+            differences += diff_values(
+                baseline.get(key), candidate.get(key), f"{path}.{key}" if path else str(key)
+            )
+        return differences
+    if isinstance(baseline, list) and isinstance(candidate, list):
+        differences = []
+        if len(baseline) != len(candidate):
+            differences.append((f"{path}.length", len(baseline), len(candidate)))
+        for i, (b, c) in enumerate(zip(baseline, candidate)):
+            differences += diff_values(b, c, f"{path}[{i}]")
+        return differences
+    return [] if baseline == candidate else [(path, baseline, candidate)]
+
+
+def field_name(path):
+    # "subjects[3].fa_pr_obt" and "subjects[5].fa_pr_obt" count as one field
+    name = "".join(part.split("]", 1)[-1] for part in path.split("["))
+    return name.lstrip(".") or path
+
+
+class ShadowRunner:
+    """
+    Runs candidate implementations of pipeline stages next to the current
+    ones on a sample of live documents, in a background thread (never on the
+    request path), and aggregates field-level differences and speedups.
+
+    Only documents picked by `sample_rate` are copied; when the backlog of
+    sampled documents reaches `max_backlog` new samples are dropped. With
+    `report_path` set the report is also written there after every document
+    ("{pid}" in the path gives each worker process its own file).
+    """
+
+    def __init__(self, candidates, sample_rate=0.0, max_backlog=100, max_examples=50, report_path=None):
+        self.candidates = candidates
+        self.sample_rate = sample_rate
+        self.report_path = report_path
+
+        self._queue = queue.Queue(maxsize=max_backlog)
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._dropped = 0
+        self._stats = {
+            stage: {
+                "documents": 0,
+                "documents_with_differences": 0,
+                "errors": 0,
+                "baseline_seconds": 0.0,
+                "candidate_seconds": 0.0,
+                "fields": Counter(),
+            }
+            for stage in candidates
+        }
+        self._examples = deque(maxlen=max_examples)
+
+    @property
+    def enabled(self):
+        return bool(self.candidates) and self.sample_rate > 0
+
+    def should_sample(self):
+        return self.enabled and random.random() < self.sample_rate
+
+    def submit(self, document, source, pdf_text, baseline, timings):
+        """
+        Queue one processed document for comparison.
+        baseline/timings are keyed by stage; source is only read when an
+        extract_text candidate needs the original PDF bytes.
+        """
+        pdf_bytes = None
+        if "extract_text" in self.candidates:
+            if hasattr(source, "read"):
+                source.seek(0)
+                pdf_bytes = source.read()
+            else:
+                with open(source, "rb") as pdf_file:
+                    pdf_bytes = pdf_file.read()
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((document, pdf_bytes, pdf_text, baseline, timings))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _ensure_thread(self):
+        # One comparison thread per process (again after a fork)
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name="shadow-runner", daemon=True).start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._compare(*item)
+            except Exception as e:
+                logging.error(f"Shadow comparison failed: {str(e)}")
+            if self.report_path:
+                self.write_report(self.report_path.format(pid=os.getpid()))
+
+    def _compare(self, document, pdf_bytes, pdf_text, baseline, timings):
+        inputs = {
+            "extract_text": lambda: io.BytesIO(pdf_bytes),
+            "parse_marksheet": lambda: pdf_text,
+            "extract_subject_table": lambda: pdf_text,
+        }
+
+        for stage in STAGES:
+            if stage not in self.candidates:
+                continue
+
+            argument = inputs[stage]()
+            started = time.perf_counter()
+            try:
+                result = self.candidates[stage](argument)
+            except Exception as e:
+                with self._lock:
+                    self._stats[stage]["errors"] += 1
+                    self._examples.append({"document": document, "stage": stage, "error": str(e)})
+                continue
+            elapsed = time.perf_counter() - started
+
+            differences = diff_values(baseline[stage], result)
+            with self._lock:
+                stats = self._stats[stage]
+                stats["documents"] += 1
+                stats["baseline_seconds"] += timings[stage]
+                stats["candidate_seconds"] += elapsed
+                if differences:
+                    stats["documents_with_differences"] += 1
+                    stats["fields"].update({field_name(path) for path, _, _ in differences})
+                for path, expected, actual in differences[:10]:
+                    self._examples.append({
+                        "document": document,
+                        "stage": stage,
+                        "field": path,
+                        "baseline": expected,
+                        "candidate": actual,
+                    })
+
+    def report(self):
+        with self._lock:
+            stages = {}
+            for stage, stats in self._stats.items():
+                stages[stage] = {
+                    "candidate": f"{self.candidates[stage].__module__}:{self.candidates[stage].__name__}",
+                    "documents": stats["documents"],
+                    "documents_with_differences": stats["documents_with_differences"],
+                    "errors": stats["errors"],
+                    "baseline_seconds": round(stats["baseline_seconds"], 4),
+                    "candidate_seconds": round(stats["candidate_seconds"], 4),
+                    "speedup": round(stats["baseline_seconds"] / stats["candidate_seconds"], 2)
+                    if stats["candidate_seconds"] else None,
+                    "differing_fields": dict(stats["fields"].most_common()),
+                }
+            return {
+                "sample_rate": self.sample_rate,
+                "backlog": self._queue.qsize(),
+                "dropped": self._dropped,
+                "stages": stages,
+                "examples": list(self._examples),
+            }
+
+    def write_report(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as report_file:
+            json.dump(self.report(), report_file, indent=2, default=str)
+        os.replace(tmp_path, path)
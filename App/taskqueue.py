@@ -0,0 +1,283 @@
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    seq INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, lease_expires);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks(job_id, seq);
+"""
+
+
+class TaskQueue:
+    """
+    Document work queue shared between the web tier and worker processes.
+
+    Task metadata lives in `<queue_dir>/queue.db` (SQLite) and the uploaded
+    PDFs in `<queue_dir>/payloads/`, so any node that mounts queue_dir can
+    run worker.py. Workers lease a task for `lease_seconds`; a task whose
+    lease expires (crashed or stuck worker) is handed out again, up to
+    `max_attempts` times before it is marked failed.
+    """
+
+    def __init__(self, queue_dir, lease_seconds=120, max_attempts=3):
+        self.queue_dir = queue_dir
+        self.payload_dir = os.path.join(queue_dir, "payloads")
+        self.db_path = os.path.join(queue_dir, "queue.db")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        os.makedirs(self.payload_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # A fresh connection per operation keeps this safe across threads and forks
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def payload_path(self, task_id):
+        return os.path.join(self.payload_dir, f"{task_id}.pdf")
+
+    # ---- web tier -------------------------------------------------------
+
+    def create_job(self):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, created_at) VALUES (?, ?)", (job_id, time.time()))
+        return job_id
+
+    def enqueue(self, job_id, filename, stream):
+        """Copy one PDF into the shared payload directory and queue it."""
+        task_id = uuid.uuid4().hex
+        tmp_path = self.payload_path(task_id) + ".part"
+        with open(tmp_path, "wb") as payload:
+            shutil.copyfileobj(stream, payload)
+        os.replace(tmp_path, self.payload_path(task_id))
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO tasks (id, job_id, seq, filename) VALUES (?, ?, ?, ?)",
+                (task_id, job_id, seq, filename),
+            )
+            conn.execute("COMMIT")
+        return task_id
+
+    def workbook_path(self, job_id):
+        return os.path.join(self.payload_dir, f"{job_id}.workbook.xlsx")
+
+    def attach_workbook(self, job_id, stream):
+        """Store an existing export that the job's results are merged into."""
+        tmp_path = self.workbook_path(job_id) + ".part"
+        with open(tmp_path, "wb") as payload:
+            shutil.copyfileobj(stream, payload)
+        os.replace(tmp_path, self.workbook_path(job_id))
+
+    def seal_job(self, job_id):
+        """Mark that no more documents will be added to the job."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET sealed = 1 WHERE id = ?", (job_id,))
+
+    def pending_count(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN ('queued', 'leased')"
+            ).fetchone()[0]
+
+    def job_status(self, job_id):
+        with self._connect() as conn:
+            job = conn.execute("SELECT sealed FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(
+                conn.execute(
+                    "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status",
+                    (job_id,),
+                ).fetchall()
+            )
+
+        total = sum(counts.values())
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        return {
+            "state": "done" if job["sealed"] and finished == total else "running",
+            "total": total,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": total - finished,
+        }
+
+    def wait_for_job(self, job_id, timeout, poll_interval=0.25):
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.job_status(job_id)
+            if status["state"] == "done" or time.monotonic() >= deadline:
+                return status
+            time.sleep(poll_interval)
+
+    def job_results(self, job_id):
+        """Parsed results of a job's successful documents, in upload order."""
+        return list(self.iter_job_results(job_id))
+
+    def iter_job_results(self, job_id, batch_size=500):
+        """Like job_results, but fetched batch_size rows at a time."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT result FROM tasks WHERE job_id = ? AND status = 'done' ORDER BY seq",
+                (job_id,),
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield json.loads(row["result"])
+
+    def purge(self, older_than):
+        """
+        Delete jobs created more than `older_than` seconds ago: their tasks
+        (with the stored results), payloads and attached workbook.
+        """
+        cutoff = time.time() - older_than
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            job_ids = [row["id"] for row in conn.execute("SELECT id FROM jobs WHERE created_at < ?", (cutoff,))]
+            task_ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT tasks.id FROM tasks JOIN jobs ON jobs.id = tasks.job_id WHERE jobs.created_at < ?",
+                    (cutoff,),
+                )
+            ]
+            conn.execute(
+                "DELETE FROM tasks WHERE job_id IN (SELECT id FROM jobs WHERE created_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+
+        for task_id in task_ids:
+            self._drop_payload(task_id)
+        for job_id in job_ids:
+            try:
+                os.remove(self.workbook_path(job_id))
+            except FileNotFoundError:
+                pass
+        return len(job_ids)
+
+    # ---- workers --------------------------------------------------------
+
+    def lease(self, worker_id):
+        """
+        Claim the oldest available task for `worker_id`.
+        Returns a dict with id, job_id, filename and payload_path, or None.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+
+            # Expired leases that used up their attempts are given up on
+            expired = conn.execute(
+                "SELECT id FROM tasks WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            ).fetchall()
+            for row in expired:
+                conn.execute(
+                    "UPDATE tasks SET status = 'failed', error = 'lease expired', lease_owner = NULL WHERE id = ?",
+                    (row["id"],),
+                )
+
+            task = conn.execute(
+                "SELECT id, job_id, filename FROM tasks"
+                " WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?)"
+                " ORDER BY rowid LIMIT 1",
+                (now,),
+            ).fetchone()
+            if task is not None:
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', attempts = attempts + 1,"
+                    " lease_owner = ?, lease_expires = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, task["id"]),
+                )
+            conn.execute("COMMIT")
+
+        for row in expired:
+            self._drop_payload(row["id"])
+
+        if task is None:
+            return None
+        return {
+            "id": task["id"],
+            "job_id": task["job_id"],
+            "filename": task["filename"],
+            "payload_path": self.payload_path(task["id"]),
+        }
+
+    def complete(self, task_id, worker_id, result):
+        """Store a result; ignored if the lease was lost to another worker."""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, lease_owner = NULL"
+                " WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), task_id, worker_id),
+            ).rowcount
+        if updated:
+            self._drop_payload(task_id)
+        return bool(updated)
+
+    def fail(self, task_id, worker_id, error):
+        """Release a task after an error: retried until max_attempts, then failed."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET error = ?, lease_owner = NULL, lease_expires = NULL,"
+                " status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END"
+                " WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (error, self.max_attempts, task_id, worker_id),
+            )
+            status = conn.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if status is not None and status["status"] == "failed":
+            self._drop_payload(task_id)
+
+    def _drop_payload(self, task_id):
+        try:
+            os.remove(self.payload_path(task_id))
+        except FileNotFoundError:
+            pass
+
+
+class _Connection:
+    """Context manager that closes the SQLite connection (sqlite3's own only commits)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self.conn.close()
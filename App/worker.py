@@ -0,0 +1,74 @@
+"""
+Extraction worker for worker mode.
+
+Pulls marksheet PDFs from the shared task queue, runs the same pipeline as the
+web tier (extract_text_from_pdf -> parse_marksheet -> extract_subject_table)
+and stores the parsed result back on the queue. Start as many as needed, on
+any node that mounts the queue directory:
+
+    python worker.py --queue-dir /shared/marksheet-queue
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+
+from app import process_pdf
+from applog import batch, correlation, log_event
+from taskqueue import TaskQueue
+
+
+def run_worker(queue, worker_id, poll_interval=1.0, max_tasks=None):
+    """Process tasks until stopped (SIGTERM/SIGINT) or max_tasks are done."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    processed = 0
+    # One summary record for the whole run; each task is logged under its job id
+    with batch("worker") as summary:
+        summary.set(worker_id=worker_id)
+        while not stopping and (max_tasks is None or processed < max_tasks):
+            task = queue.lease(worker_id)
+            if task is None:
+                time.sleep(poll_interval)
+                continue
+
+            with correlation(batch=task["job_id"], document=task["id"]):
+                try:
+                    result = process_pdf(task["payload_path"], task["filename"])
+                except Exception as e:
+                    log_event("task.failed", f"Worker {worker_id} failed on {task['filename']}: {str(e)}", logging.ERROR)
+                    summary.failed += 1
+                    queue.fail(task["id"], worker_id, str(e))
+                else:
+                    if not queue.complete(task["id"], worker_id, result):
+                        log_event("task.lease_lost", f"Worker {worker_id} lost the lease on {task['filename']}", logging.WARNING)
+            processed += 1
+
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MSBTE marksheet extraction worker")
+    parser.add_argument("--queue-dir", default=os.environ.get("TASK_QUEUE_DIR"), help="shared task queue directory (default: $TASK_QUEUE_DIR)")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--lease-seconds", type=int, default=120)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--max-tasks", type=int, default=None, help="exit after this many documents")
+    args = parser.parse_args()
+
+    if not args.queue_dir:
+        parser.error("--queue-dir or TASK_QUEUE_DIR is required")
+
+    queue = TaskQueue(args.queue_dir, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    logging.info(f"Worker {args.worker_id} polling {args.queue_dir}")
+    run_worker(queue, args.worker_id, poll_interval=args.poll_interval, max_tasks=args.max_tasks)
@@ -0,0 +1,40 @@
+"""
+Production WSGI entry point.
+
+Importing this module loads the app together with the heavy parts of
+pdfminer, pandas and openpyxl, so that with gunicorn's preload_app the
+master pays for them once and the forked workers share the pages
+copy-on-write. Run with:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import logging
+import os
+
+# Modules pulled in lazily on the first request are imported up front
+import openpyxl  # noqa: F401
+import openpyxl.writer.excel  # noqa: F401
+import pandas  # noqa: F401
+import pandas.io.excel  # noqa: F401
+import pdfminer.converter  # noqa: F401
+import pdfminer.layout  # noqa: F401
+import pdfminer.pdfinterp  # noqa: F401
+
+import app as marksheet_app
+from app import app
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+WARMUP_PDF = os.environ.get(
+    "WARMUP_PDF", os.path.join(BASE_DIR, os.pardir, "Uploads", "copy_4.pdf")
+)
+
+
+def warm_up():
+    """Parse a sample marksheet so the first real request runs on warm caches."""
+    if not os.path.exists(WARMUP_PDF):
+        logging.warning(f"Warm-up marksheet '{WARMUP_PDF}' not found, skipping warm-up")
+        return
+
+    marksheet_app.process_pdf(WARMUP_PDF)
+    # The warm-up document does not count towards worker recycling
+    marksheet_app.processed_documents = 0
@@ -0,0 +1,76 @@
+import random
+
+import openpyxl
+import pytest
+
+from app import BatchAssembler, save_to_excel
+
+
+def make_students(count, seed=7):
+    rng = random.Random(seed)
+    students = []
+    for i in range(count):
+        # Few distinct values so Percentage / Gain Marks ties are common
+        percentage = rng.choice([None, "N/A", 55.5, 63.0, 63.0, 71.25, 88.0])
+        gain_marks = rng.choice([None, "N/A", 410, 455, 455, 500])
+        student = {
+            "Student Name": f"STUDENT {i}",
+            "Enrollment No": str(23511510000 + i),
+            "Examination": "WINTER 2024",
+            "Seat No": str(432000 + i),
+            "Semester": rng.choice(["THIRD", "FOURTH"]),
+            "Percentage": percentage,
+            "Gain Marks": gain_marks,
+            "Total Marks": 700,
+            "Total Credits": rng.choice([None, 22]),
+            "Student Year": "Second Year",
+            "Result": rng.choice(["FIRST CLASS", "SECOND CLASS"]),
+            "subjects": [
+                {"subject_name": f"SUBJECT {n}", "fa_pr_max": 50, "fa_pr_obt": rng.randint(0, 50)}
+                for n in range(rng.randint(0, 3))
+            ],
+        }
+        if i % 11 == 0:
+            student["Remarks"] = "RE-ASSESSED"
+        students.append(student)
+    return students
+
+
+def sheet_values(path):
+    # Trailing empty cells are not written by the write-only workbook, so rows are
+    # padded to the header width before comparing
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        sheets = {}
+        for sheet in workbook.worksheets:
+            rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+            width = len(rows[0])
+            sheets[sheet.title] = [row + [None] * (width - len(row)) for row in rows]
+        return sheets
+    finally:
+        workbook.close()
+
+
+@pytest.mark.parametrize("run_size", [1, 3, 10, 64, 1000])
+def test_matches_save_to_excel(tmp_path, run_size):
+    students = make_students(120)
+    expected_file = tmp_path / "expected.xlsx"
+    save_to_excel(students, expected_file)
+
+    assembler = BatchAssembler(run_size=run_size, spill_dir=str(tmp_path))
+    try:
+        for student in students:
+            assembler.add(student)
+        assembler.write_excel(tmp_path / "assembled.xlsx")
+    finally:
+        assembler.close()
+
+    assert sheet_values(tmp_path / "assembled.xlsx") == sheet_values(expected_file)
+
+
+def test_close_removes_spill_dir(tmp_path):
+    assembler = BatchAssembler(run_size=2, spill_dir=str(tmp_path))
+    for student in make_students(5):
+        assembler.add(student)
+    assembler.close()
+    assert list(tmp_path.iterdir()) == []
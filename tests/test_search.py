@@ -0,0 +1,87 @@
+import io
+import os
+import re
+
+import pytest
+
+import app as webapp
+from search import StudentIndex
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STUDENTS = [
+    {"Student Name": "KAWDE POOJA DEVIDAS", "Enrollment No": "23511510235", "Seat No": "432135",
+     "Examination": "WINTER 2024", "Semester": "THIRD", "Percentage": 63.0, "Result": "FIRST CLASS"},
+    {"Student Name": "JADHAV GAURI RAVINDRA", "Enrollment No": "23511510240", "Seat No": "432140",
+     "Examination": "WINTER 2024", "Semester": "THIRD", "Percentage": None, "Result": "FAIL"},
+    {"Student Name": "POOJA KAWDE", "Enrollment No": "23511510299", "Seat No": "432199",
+     "Examination": "WINTER 2024", "Semester": "FOURTH", "Percentage": 71.5, "Result": "FIRST CLASS"},
+]
+
+
+def test_dump_and_load_give_the_same_answers():
+    index = StudentIndex()
+    index.add_many(STUDENTS)
+    index.add_many([dict(STUDENTS[0], Percentage=64.0)])
+
+    buffer = io.StringIO()
+    index.dump(buffer)
+    buffer.seek(0)
+    loaded = StudentIndex.load(buffer)
+
+    assert len(loaded) == len(index) == 3
+    for query in ["KAWDE POOJA", "JADAV", "2351151024", "4321"]:
+        assert loaded.search(query) == index.search(query)
+
+    # Still usable for updates after loading
+    loaded.add_many([dict(STUDENTS[1], Percentage=40.0)])
+    assert len(loaded) == 3
+    assert loaded.search("JADHAV GAURI")[0]["Percentage"] == 40.0
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(webapp, "task_queue", None)
+    monkeypatch.setattr(webapp, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setitem(webapp.app.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(webapp.artifacts, "root", str(tmp_path))
+    monkeypatch.setattr(webapp.artifacts, "sweep_interval", 0)
+    monkeypatch.setattr(webapp, "batch_indexes", webapp.OrderedDict())
+    return tmp_path
+
+
+def upload_batch(client):
+    with open(os.path.join(ROOT, "Uploads", "copy_3.pdf"), "rb") as pdf:
+        response = client.post("/upload", data={"files": [(pdf, "copy_3.pdf")]}, content_type="multipart/form-data")
+    assert response.status_code == 200
+    return re.search(r"output_[0-9a-f]{32}\.xlsx", response.get_data(as_text=True)).group()
+
+
+def test_search_uses_the_index_written_with_the_export(uploads):
+    client = webapp.app.test_client()
+    excel_file = upload_batch(client)
+    assert os.path.exists(uploads / excel_file.replace(".xlsx", ".index.json"))
+
+    # A fresh process only has the files
+    webapp.batch_indexes.clear()
+    response = client.get(f"/search?q=23511510292&batch={excel_file}")
+    assert response.status_code == 200
+    assert [row["Enrollment No"] for row in response.get_json()["results"]] == ["23511510292"]
+
+
+def test_search_rebuilds_a_missing_index_from_the_workbook(uploads):
+    client = webapp.app.test_client()
+    excel_file = upload_batch(client)
+    expected = client.get(f"/search?q=23511510292&batch={excel_file}").get_json()["results"]
+
+    webapp.batch_indexes.clear()
+    os.remove(uploads / excel_file.replace(".xlsx", ".index.json"))
+    assert client.get(f"/search?q=23511510292&batch={excel_file}").get_json()["results"] == expected
+    assert os.path.exists(uploads / excel_file.replace(".xlsx", ".index.json"))
+
+
+def test_search_needs_a_known_batch(uploads):
+    client = webapp.app.test_client()
+    assert client.get("/search?q=KAWDE").status_code == 400
+    assert client.get(f"/search?q=KAWDE&batch=output_{'0' * 32}.xlsx").status_code == 404
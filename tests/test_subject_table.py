@@ -0,0 +1,26 @@
+import glob
+import json
+import os
+
+import pytest
+from pdfminer.high_level import extract_text
+
+from app import extract_subject_table
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# extract_subject_table output of the line-scanning parser it replaced, per sample marksheet
+with open(os.path.join(ROOT, "tests", "fixtures", "subject_tables.json")) as fixture:
+    EXPECTED = json.load(fixture)
+
+
+@pytest.mark.parametrize("pdf", sorted(glob.glob(os.path.join(ROOT, "Uploads", "copy_*.pdf"))), ids=os.path.basename)
+def test_matches_previous_parser(pdf):
+    assert extract_subject_table(extract_text(pdf)) == EXPECTED[os.path.basename(pdf)]
+
+
+def test_fixture_covers_samples():
+    samples = {os.path.basename(pdf) for pdf in glob.glob(os.path.join(ROOT, "Uploads", "copy_*.pdf"))}
+    assert samples == set(EXPECTED)
+    assert any(EXPECTED.values())
@@ -0,0 +1,182 @@
+import glob
+import io
+import os
+
+import openpyxl
+import pytest
+
+import app as webapp
+import taskqueue
+from taskqueue import TaskQueue
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF = os.path.join(ROOT, "Uploads", "copy_3.pdf")
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(taskqueue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return TaskQueue(str(tmp_path / "queue"), lease_seconds=60, max_attempts=2)
+
+
+def enqueue_one(queue):
+    job_id = queue.create_job()
+    task_id = queue.enqueue(job_id, "a.pdf", io.BytesIO(b"%PDF-1.4"))
+    queue.seal_job(job_id)
+    return job_id, task_id
+
+
+def test_lease_is_exclusive_until_it_expires(queue, clock):
+    job_id, task_id = enqueue_one(queue)
+
+    task = queue.lease("w1")
+    assert task["id"] == task_id and task["job_id"] == job_id
+    assert os.path.exists(task["payload_path"])
+    assert queue.lease("w2") is None
+
+    clock.now += 61
+    assert queue.lease("w2")["id"] == task_id
+
+
+def test_complete_after_lost_lease_is_ignored(queue, clock):
+    job_id, task_id = enqueue_one(queue)
+    queue.lease("w1")
+    clock.now += 61
+    queue.lease("w2")
+
+    assert queue.complete(task_id, "w1", {"stale": True}) is False
+    assert queue.complete(task_id, "w2", {"fresh": True}) is True
+    assert queue.job_results(job_id) == [{"fresh": True}]
+    assert queue.job_status(job_id)["state"] == "done"
+    assert not os.path.exists(queue.payload_path(task_id))
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    job_id, task_id = enqueue_one(queue)
+
+    queue.lease("w1")
+    queue.fail(task_id, "w1", "boom")
+    assert queue.job_status(job_id)["pending"] == 1
+
+    queue.lease("w1")
+    queue.fail(task_id, "w1", "boom again")
+    status = queue.job_status(job_id)
+    assert status["failed"] == 1 and status["state"] == "done"
+    assert queue.lease("w1") is None
+    assert not os.path.exists(queue.payload_path(task_id))
+
+
+def test_expired_lease_after_max_attempts_is_failed(queue, clock):
+    job_id, task_id = enqueue_one(queue)
+    queue.lease("w1")
+    clock.now += 61
+    queue.lease("w2")
+    clock.now += 61
+
+    # Both attempts used up by workers that never came back
+    assert queue.lease("w3") is None
+    assert queue.job_status(job_id)["failed"] == 1
+    assert not os.path.exists(queue.payload_path(task_id))
+
+
+def test_purge_drops_old_jobs_with_their_files(queue, clock):
+    old_job, old_task = enqueue_one(queue)
+    queue.attach_workbook(old_job, io.BytesIO(b"xlsx"))
+    clock.now += 3600
+    new_job, new_task = enqueue_one(queue)
+
+    assert queue.purge(older_than=1800) == 1
+    assert queue.job_status(old_job) is None
+    assert not os.path.exists(queue.payload_path(old_task))
+    assert not os.path.exists(queue.workbook_path(old_job))
+    assert queue.job_status(new_job)["pending"] == 1
+    assert os.path.exists(queue.payload_path(new_task))
+
+
+# Worker mode end to end: /upload -> lease/complete (as worker.py does) -> /jobs -> /download
+
+@pytest.fixture
+def worker_mode(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    queue = TaskQueue(str(tmp_path / "queue"))
+    monkeypatch.setattr(webapp, "task_queue", queue)
+    monkeypatch.setattr(webapp, "UPLOAD_FOLDER", str(uploads))
+    monkeypatch.setitem(webapp.app.config, "UPLOAD_FOLDER", str(uploads))
+    monkeypatch.setitem(webapp.app.config, "JOB_WAIT_TIMEOUT", 0)
+    monkeypatch.setattr(webapp.artifacts, "root", str(uploads))
+    monkeypatch.setattr(webapp.artifacts, "sweep_interval", 0)
+    return queue
+
+
+def upload_job(client, data):
+    response = client.post("/upload", data=data, content_type="multipart/form-data")
+    assert response.status_code == 202
+    return response.get_json()["job_id"]
+
+
+def run_tasks(queue):
+    while True:
+        task = queue.lease("w1")
+        if task is None:
+            return
+        assert queue.complete(task["id"], "w1", webapp.process_pdf(task["payload_path"], task["filename"]))
+
+
+def download_rows(client, job_id, tmp_path):
+    status = client.get(f"/jobs/{job_id}")
+    assert status.status_code == 200
+    body = status.get_json()
+    assert body["state"] == "done"
+
+    response = client.get(body["download_url"])
+    assert response.status_code == 200
+    output = tmp_path / "download.xlsx"
+    output.write_bytes(response.data)
+    workbook = openpyxl.load_workbook(output, read_only=True)
+    try:
+        return {sheet.title: list(sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def test_worker_mode_job_output(worker_mode, tmp_path):
+    client = webapp.app.test_client()
+    with open(SAMPLE_PDF, "rb") as pdf:
+        job_id = upload_job(client, {"files": [(pdf, "copy_3.pdf")]})
+    assert client.get(f"/jobs/{job_id}").get_json()["state"] == "running"
+
+    run_tasks(worker_mode)
+    sheets = download_rows(client, job_id, tmp_path)
+
+    assert [row[1] for row in sheets["Student Summary"][1:]] == ["23511510292"]
+    assert len(sheets["Subject Marks"]) > 1
+    assert glob.glob(os.path.join(webapp.UPLOAD_FOLDER, ".partial-*")) == []
+
+
+def test_worker_mode_job_merges_workbook(worker_mode, tmp_path):
+    client = webapp.app.test_client()
+    with open(SAMPLE_PDF, "rb") as pdf, open(os.path.join(ROOT, "Uploads", "test_output.xlsx"), "rb") as workbook:
+        job_id = upload_job(client, {"files": [(pdf, "copy_3.pdf")], "workbook": (workbook, "test_output.xlsx")})
+
+    run_tasks(worker_mode)
+    sheets = download_rows(client, job_id, tmp_path)
+
+    # The exported student is kept and the new marksheet added
+    assert sorted(row[1] for row in sheets["Student Summary"][1:]) == ["23511510235", "23511510292"]
+    assert glob.glob(os.path.join(webapp.UPLOAD_FOLDER, ".partial-*")) == []
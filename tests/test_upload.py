@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import app as webapp
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOUNDARY = "----upload-test"
+
+
+def multipart_body():
+    with open(os.path.join(ROOT, "Uploads", "copy_3.pdf"), "rb") as pdf:
+        data = pdf.read()
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="files"; filename="copy_3.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def post(body):
+    client = webapp.app.test_client()
+    return client.post("/upload", data=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
+
+
+@pytest.fixture(autouse=True)
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(webapp, "task_queue", None)
+    monkeypatch.setattr(webapp, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(webapp.artifacts, "root", str(tmp_path))
+    monkeypatch.setattr(webapp.artifacts, "sweep_interval", 0)
+    return tmp_path
+
+
+@pytest.mark.parametrize("cut", [200, 5000, -10])
+def test_truncated_body_is_a_bad_request(cut, uploads):
+    response = post(multipart_body()[:cut])
+    assert response.status_code == 400
+    assert os.listdir(uploads) == []
+
+
+def test_garbage_body_is_a_bad_request():
+    response = post(b"--" + BOUNDARY.encode() + b"\r\nnot a header line\r\n\r\n" + b"x" * 100)
+    assert response.status_code == 400